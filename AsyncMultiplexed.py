@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+from collections import OrderedDict, deque
+from MultiplexedDecoder import MultiplexedDecoder
+
+class LnavStream:
+    """
+    A bounded queue of decoded LNAVs which can be read with "async for".  Each item is a (source, lnav) tuple, where
+    source identifies the feed the LNAV was received from.  One stream may be shared by any number of protocols, and
+    read by any number of tasks, each LNAV going to one of them.
+
+    When the stream is full, TCP connections feeding it stop reading until the consumer catches up, so no data is
+    lost.  UDP can't be paused, so the oldest queued LNAV is dropped instead and counted in Dropped.
+
+    Methods
+    -------
+    Close() ends the iteration once the queued LNAVs have been read
+    """
+
+    def __init__(self, maxsize=1024):
+        self.__maxsize = maxsize
+        self.__items = deque()
+        # Futures of the tasks waiting for an LNAV, in the order they started waiting
+        self.__waiters = deque()
+        self.__paused = set()
+        self.__closed = False
+        self.Dropped = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.__items:
+            if self.__closed:
+                raise StopAsyncIteration
+            waiter = asyncio.get_running_loop().create_future()
+            self.__waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if not waiter.cancelled():
+                    # Woken for an LNAV but cancelled before taking it, so pass the wake up on to another task
+                    self.__Wake()
+                raise
+
+        item = self.__items.popleft()
+        # Resume paused connections once the queue has drained to half full
+        if self.__paused and len(self.__items) <= self.__maxsize // 2:
+            for transport in self.__paused:
+                if not transport.is_closing():
+                    transport.resume_reading()
+            self.__paused.clear()
+        return item
+
+    def __len__(self):
+        return len(self.__items)
+
+    def Close(self):
+        """
+        Close() ends the iteration once the queued LNAVs have been read.
+
+        Returns
+        -------
+        None.
+        """
+        self.__closed = True
+        for waiter in self.__waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.__waiters.clear()
+
+    def _Put(self, source, lnav, transport=None):
+        """
+        _Put queues a decoded LNAV.
+
+        Parameters
+        ----------
+        source : identifies the feed the LNAV was received from
+        lnav : the decoded LNAV
+        transport : transport which may be paused if the stream is full, or None if it can't be paused
+
+        Returns
+        -------
+        None.
+        """
+        items = self.__items
+        if len(items) >= self.__maxsize:
+            if transport is None:
+                items.popleft()
+                self.Dropped += 1
+            elif transport not in self.__paused:
+                # The LNAVs already decoded from this chunk are still queued, so the stream can briefly hold more
+                # than maxsize items
+                transport.pause_reading()
+                self.__paused.add(transport)
+        items.append((source, lnav))
+        self.__Wake()
+
+    def _Forget(self, transport):
+        """
+        _Forget stops tracking a transport which has been closed.
+
+        Parameters
+        ----------
+        transport : the closed transport
+
+        Returns
+        -------
+        None.
+        """
+        self.__paused.discard(transport)
+
+    def __Wake(self):
+        # Wake the task which has waited longest, skipping any which have been cancelled
+        while self.__waiters:
+            waiter = self.__waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+class MultiplexedProtocol(asyncio.Protocol):
+    """
+    An asyncio Protocol which decodes a multiplexed byte stream received over a connection (e.g. TCP), using a
+    MultiplexedDecoder of its own.  Decoded LNAVs are passed to a callback, queued on an LnavStream, or both.
+
+    Use as the protocol factory of loop.create_connection() or loop.create_server(), for example:
+
+        loop.create_connection(lambda: MultiplexedProtocol(stream=stream), host, port)
+    """
+
+    def __init__(self, callback=None, stream=None, lazy=False, source=None):
+        """
+        Parameters
+        ----------
+        callback : function taking (source, lnav), called for each LNAV decoded, or None
+        stream : LnavStream to queue each LNAV decoded on, or None
+        lazy : if True LazyLNAV objects are delivered instead of LNAV objects
+        source : identifies this connection's LNAVs, or None to use the address of the remote end
+        """
+        self.__callback = callback
+        self.__stream = stream
+        self.__transport = None
+        self.__source = source
+        self.Decoder = MultiplexedDecoder()
+        self.Decoder.AddLnavCallback(self.__LnavReceived, lazy)
+
+    def connection_made(self, transport):
+        self.__transport = transport
+        if self.__source is None:
+            self.__source = transport.get_extra_info("peername")
+
+    def data_received(self, data):
+        self.Decoder.DecodeBytes(data)
+
+    def connection_lost(self, exc):
+        if self.__stream is not None:
+            self.__stream._Forget(self.__transport)
+        self.__transport = None
+
+    def __LnavReceived(self, lnav):
+        if self.__callback is not None:
+            self.__callback(self.__source, lnav)
+        if self.__stream is not None:
+            self.__stream._Put(self.__source, lnav, self.__transport)
+
+class MultiplexedDatagramProtocol(asyncio.DatagramProtocol):
+    """
+    An asyncio DatagramProtocol which decodes multiplexed bytes received over UDP.  Each sender address gets a
+    MultiplexedDecoder of its own, so messages split across datagrams are reassembled per sender.  Decoded LNAVs are
+    passed to a callback, queued on an LnavStream, or both, with the sender address as their source.
+
+    Senders come and go (a restarted sender usually gets a new port), so once maxSources senders have been seen the
+    decoder of the one heard from least recently is discarded, losing at most its partly received message.
+    RemoveSource() discards a sender's decoder straight away.
+
+    Use as the protocol factory of loop.create_datagram_endpoint(), for example:
+
+        loop.create_datagram_endpoint(lambda: MultiplexedDatagramProtocol(stream=stream), local_addr=(host, port))
+    """
+
+    def __init__(self, callback=None, stream=None, lazy=False, maxSources=1024):
+        """
+        Parameters
+        ----------
+        callback : function taking (source, lnav), called for each LNAV decoded, or None
+        stream : LnavStream to queue each LNAV decoded on, or None
+        lazy : if True LazyLNAV objects are delivered instead of LNAV objects
+        maxSources : most senders to keep a decoder for, or None for no limit
+        """
+        self.__callback = callback
+        self.__stream = stream
+        self.__lazy = lazy
+        self.__maxSources = maxSources
+        # Maps each sender address to its decoder, the one heard from least recently first
+        self.Decoders = OrderedDict()
+
+    def datagram_received(self, data, addr):
+        decoder = self.Decoders.get(addr)
+        if decoder is None:
+            decoder = MultiplexedDecoder()
+            decoder.AddLnavCallback(lambda lnav: self.__LnavReceived(addr, lnav), self.__lazy)
+            self.Decoders[addr] = decoder
+            if self.__maxSources is not None and len(self.Decoders) > self.__maxSources:
+                self.Decoders.popitem(last=False)
+        else:
+            self.Decoders.move_to_end(addr)
+        decoder.DecodeBytes(data)
+
+    def RemoveSource(self, addr):
+        """
+        RemoveSource() discards the decoder of a sender which has stopped sending.
+
+        Parameters
+        ----------
+        addr : the sender address
+
+        Returns
+        -------
+        None.
+        """
+        self.Decoders.pop(addr, None)
+
+    def __LnavReceived(self, source, lnav):
+        if self.__callback is not None:
+            self.__callback(source, lnav)
+        if self.__stream is not None:
+            self.__stream._Put(source, lnav)
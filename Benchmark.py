@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Measures the throughput of the decoder on a synthetic multiplexed stream, so that changes in performance can be
+# tracked.  Run "python Benchmark.py --help" for the options.
+
+import argparse
+import time
+from collections import Counter
+import MultiplexedDecoder as md
+from LNAV import LNAV
+from SyntheticStream import Chunks, GenerateStream, InjectErrors
+
+def _Report(name, seconds, byteCount, frameCount):
+    print("{:<32} {:>10.2f} MB/s {:>12.0f} frames/s".format(name, byteCount / seconds / 1e6, frameCount / seconds))
+
+def BenchmarkDecodeBytes(stream, expectedFrames, chunkSize, repeats):
+    """
+    BenchmarkDecodeBytes() times MultiplexedDecoder.DecodeBytes() with the stream delivered in chunks of chunkSize
+    bytes, and checks that every uncorrupted message was decoded.
+
+    Returns
+    -------
+    float : best time in seconds
+    """
+    chunks = Chunks(stream, chunkSize)
+    best = None
+    for i in range(repeats):
+        decoded = []
+        decoder = md.MultiplexedDecoder()
+        decoder.AddLnavCallback(decoded.append)
+        start = time.perf_counter()
+        for chunk in chunks:
+            decoder.DecodeBytes(chunk)
+        elapsed = time.perf_counter() - start
+        if len(decoded) != expectedFrames:
+            raise RuntimeError("Decoded {} frames, expected {}".format(len(decoded), expectedFrames))
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def BenchmarkLnavDecode(payloads, repeats):
+    """
+    BenchmarkLnavDecode() times LNAV.Decode() on each payload in turn.
+
+    Returns
+    -------
+    float : best time in seconds
+    """
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        for payload in payloads:
+            LNAV.Decode(payload)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def BenchmarkDecodeBatch(payloads, repeats):
+    """
+    BenchmarkDecodeBatch() times LNAV.DecodeBatch() on all of the payloads at once.
+
+    Returns
+    -------
+    float : best time in seconds
+    """
+    buffer = b"".join(payloads)
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        LNAV.DecodeBatch(buffer)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def BenchmarkRecovery(stream, payloads, recover, repeats):
+    """
+    BenchmarkRecovery() times MultiplexedDecoder.DecodeBytes() on a damaged stream, with or without recovery mode,
+    and counts how many of the original messages came through.
+
+    Returns
+    -------
+    tuple of (best time in seconds, number of original messages decoded, number of decoded messages which weren't
+    in the original stream, number of messages recovered)
+    """
+    best = None
+    for i in range(repeats):
+        decoded = []
+        decoder = md.MultiplexedDecoder()
+        decoder.EnableStats()
+        if recover:
+            decoder.EnableRecovery()
+        decoder.Subscribe(md._MessageId.LNAV.value, decoded.append, bytes)
+        start = time.perf_counter()
+        decoder.DecodeBytes(stream)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    good = sum((Counter(decoded) & Counter(payloads)).values())
+    return best, good, len(decoded) - good, decoder.GetStats()["FramesRecovered"]
+
+def Main():
+    parser = argparse.ArgumentParser(description="Multiplexed LNAV decoder throughput benchmark")
+    parser.add_argument("--frames", type=int, default=20000, help="number of LNAV messages in the stream")
+    parser.add_argument("--seed", type=int, default=0, help="random number seed for the stream")
+    parser.add_argument("--dle-density", type=float, default=1.0 / 256, help="probability of each payload byte being a DLE")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="probability of a message being corrupted")
+    parser.add_argument("--noise", type=int, default=0, help="maximum number of noise bytes between messages")
+    parser.add_argument("--error-rate", type=float, default=0.001, help="probability of each byte being dropped, replaced or duplicated in the recovery benchmark")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1, 16, 256, 4096, 65536], help="delivery chunk sizes in bytes")
+    parser.add_argument("--repeats", type=int, default=3, help="number of times to run each benchmark (the best is reported)")
+    args = parser.parse_args()
+
+    stream, payloads = GenerateStream(args.frames, args.seed, args.dle_density, args.corrupt_rate, args.noise)
+    print("Stream : {} bytes, {} messages, {} valid".format(len(stream), args.frames, len(payloads)))
+
+    for chunkSize in args.chunk_sizes:
+        seconds = BenchmarkDecodeBytes(stream, len(payloads), chunkSize, args.repeats)
+        _Report("DecodeBytes ({} byte chunks)".format(chunkSize), seconds, len(stream), len(payloads))
+
+    damaged = InjectErrors(stream, args.error_rate, args.seed)
+    for recover in (False, True):
+        seconds, good, bad, recovered = BenchmarkRecovery(damaged, payloads, recover, args.repeats)
+        _Report("Damaged stream ({})".format("recovery" if recover else "no recovery"), seconds, len(damaged), good)
+        print("{:<32} {:>10.2f} % yield, {} recovered, {} false".format("", 100.0 * good / len(payloads), recovered, bad))
+
+    payloadBytes = len(payloads) * len(payloads[0]) if payloads else 0
+    _Report("LNAV.Decode", BenchmarkLnavDecode(payloads, args.repeats), payloadBytes, len(payloads))
+    try:
+        _Report("LNAV.DecodeBatch", BenchmarkDecodeBatch(payloads, args.repeats), payloadBytes, len(payloads))
+    except ImportError:
+        print("LNAV.DecodeBatch skipped - numpy is not installed")
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Measures how many LNAVs per second one asyncio event loop can decode from many concurrent TCP feeds.  A stand-in
+# for the topside units is started in a separate process on the loopback interface, which streams the sample message
+# from ExampleLnavDecoder.py to every connection.
+#
+# Usage: python BenchmarkAsync.py [number of feeds] [seconds]
+
+import asyncio
+import multiprocessing
+import sys
+import time
+from AsyncMultiplexed import LnavStream, MultiplexedProtocol
+from ExampleLnavDecoder import testMessage
+
+async def _ServeFeed(reader, writer):
+    """
+    _ServeFeed is the stand-in topside unit - it sends the sample message repeatedly until the connection closes
+    """
+    block = bytes(testMessage) * 100
+    try:
+        # Wait for the client to say go, so that streaming doesn't slow down opening the other connections
+        await reader.readexactly(1)
+        while True:
+            writer.write(block)
+            await writer.drain()
+            # Let the other connections have a turn
+            await asyncio.sleep(0)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def _StandInServer(ports):
+    server = await asyncio.start_server(_ServeFeed, "127.0.0.1", 0)
+    ports.put(server.sockets[0].getsockname()[1])
+    await server.serve_forever()
+
+def _RunStandInServer(ports):
+    asyncio.run(_StandInServer(ports))
+
+async def _Consume(stream, counts):
+    async for source, lnav in stream:
+        counts[source] = counts.get(source, 0) + 1
+
+async def Run(feeds, seconds):
+    # The server mustn't inherit this process's running event loop, so spawn rather than fork it
+    context = multiprocessing.get_context("spawn")
+    ports = context.Queue()
+    server = context.Process(target=_RunStandInServer, args=(ports,), daemon=True)
+    server.start()
+    port = ports.get()
+    loop = asyncio.get_running_loop()
+
+    stream = LnavStream(maxsize=4096)
+    counts = {}
+    consumer = asyncio.ensure_future(_Consume(stream, counts))
+
+    transports = []
+    for i in range(feeds):
+        transport, protocol = await loop.create_connection(lambda: MultiplexedProtocol(stream=stream, source=i), "127.0.0.1", port)
+        transports.append(transport)
+    for transport in transports:
+        transport.write(b"\x00")
+
+    start = time.perf_counter()
+    await asyncio.sleep(seconds)
+    elapsed = time.perf_counter() - start
+
+    for transport in transports:
+        transport.close()
+    stream.Close()
+    await consumer
+    server.terminate()
+    server.join()
+
+    total = sum(counts.values())
+    print("Feeds : {}".format(feeds))
+    print("Feeds delivering LNAVs : {}".format(len(counts)))
+    print("LNAVs decoded : {}".format(total))
+    print("LNAVs per second : {:.0f}".format(total / elapsed))
+    print("MB per second : {:.2f}".format(total * len(testMessage) / elapsed / 1e6))
+
+if __name__ == "__main__":
+    feeds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    asyncio.run(Run(feeds, seconds))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import mmap
+from collections import namedtuple
+from MultiplexedDecoder import MultiplexedDecoder, _MESSAGE_TYPES
+
+# A message read from a capture file.  Offset is the file position of the message's DLE+STX.  Message is the decoded
+# message (an LNAV object for LNAV messages) if the message ID has been registered with RegisterMessageType(), and the
+# raw payload bytes otherwise.
+CaptureFrame = namedtuple("CaptureFrame", ["Offset", "MessageId", "Message"])
+
+# Number of file bytes framed before the messages found in them are handed back to the caller
+_BLOCK_SIZE = 1 << 20
+
+class CaptureFile:
+    """
+    A Class which replays a file of raw multiplexed bytes, as recorded from a serial port or socket.  The file is
+    memory mapped and framed in place, so only the messages themselves are copied and memory use does not grow with
+    the size of the file.
+
+    May be used as a context manager, which closes the file on exit.
+
+    Methods
+    -------
+    Frames(start offset, end offset) returns a generator of CaptureFrame
+
+    RawFrames(start offset, end offset) returns a generator of Frame
+
+    ReadFrame(offset, length) returns CaptureFrame
+
+    ReadBytes(offset, length) returns bytes
+
+    Close()
+    """
+
+    def __init__(self, path):
+        self.__file = open(path, "rb")
+        self.__map = None
+        try:
+            # mmap can't map an empty file
+            if self.__file.seek(0, 2) > 0:
+                self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(self.__map, "madvise"):
+                    self.__map.madvise(mmap.MADV_SEQUENTIAL)
+        except Exception:
+            self.__file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.Close()
+
+    def __len__(self):
+        return 0 if self.__map is None else len(self.__map)
+
+    def Close(self):
+        """
+        Close() unmaps and closes the capture file.
+
+        Returns
+        -------
+        None.
+        """
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        self.__file.close()
+
+    def Frames(self, start=0, end=None):
+        """
+        Frames() is a generator which decodes the capture file and yields each message which passes its checksum, in
+        file order.
+
+        Parameters
+        ----------
+        start : file offset to start decoding from.  Messages which started before this offset are skipped.
+        end : file offset to stop decoding at, or None to decode to the end of the file.  Messages which are not
+        complete by this offset are not returned.
+
+        Returns
+        -------
+        generator of CaptureFrame
+        """
+        for frame in self.RawFrames(start, end):
+            if frame.ChecksumOk:
+                yield CaptureFrame(frame.Offset, frame.MessageId, _DecodePayload(frame))
+
+    def RawFrames(self, start=0, end=None):
+        """
+        RawFrames() is a generator which frames the capture file and yields every complete message, including those
+        which fail their checksum, without decoding their payloads.
+
+        Parameters
+        ----------
+        start : file offset to start framing from
+        end : file offset to stop framing at, or None to frame to the end of the file
+
+        Returns
+        -------
+        generator of Frame, with Offset relative to the start of the file
+        """
+        if self.__map is None:
+            return
+        if end is None or end > len(self.__map):
+            end = len(self.__map)
+
+        frames = []
+        decoder = MultiplexedDecoder()
+        decoder.AddFrameCallback(frames.append)
+
+        # The decoder counts offsets from the first byte it is given
+        pos = start
+        while pos < end:
+            blockEnd = min(pos + _BLOCK_SIZE, end)
+            decoder._Frame(self.__map, pos, blockEnd)
+            pos = blockEnd
+
+            for frame in frames:
+                yield frame._replace(Offset=start + frame.Offset)
+            frames.clear()
+
+    def ReadFrame(self, offset, length):
+        """
+        ReadFrame() decodes a single message at a known position in the file, such as one found by RawFrames().
+
+        Parameters
+        ----------
+        offset : file offset of the message's DLE+STX
+        length : number of file bytes from the DLE+STX to the DLE+ETX inclusive
+
+        Returns
+        -------
+        CaptureFrame, or None if there isn't a valid message at that position
+        """
+        if self.__map is None or offset < 0 or offset + length > len(self.__map):
+            return None
+
+        frames = []
+        decoder = MultiplexedDecoder()
+        decoder.AddFrameCallback(frames.append)
+        decoder._Frame(self.__map, offset, offset + length)
+        if len(frames) != 1 or not frames[0].ChecksumOk or frames[0].Length != length:
+            return None
+        return CaptureFrame(offset, frames[0].MessageId, _DecodePayload(frames[0]))
+
+    def ReadBytes(self, offset, length):
+        """
+        ReadBytes() returns raw bytes from the file, exactly as they were recorded.
+
+        Parameters
+        ----------
+        offset : file offset of the first byte
+        length : number of bytes to read (fewer are returned at the end of the file)
+
+        Returns
+        -------
+        bytes
+        """
+        if self.__map is None:
+            return b""
+        return self.__map[offset:offset + length]
+
+def _DecodePayload(frame):
+    """
+    _DecodePayload decodes the payload of a frame if its message ID is one the decoder understands.
+
+    Parameters
+    ----------
+    frame : Frame which has passed its checksum
+
+    Returns
+    -------
+    the decoded message for registered message types of the right length, otherwise the payload bytes
+    """
+    payload = frame.Message[2:-1]
+    messageType = _MESSAGE_TYPES.get(frame.MessageId)
+    if messageType is not None and messageType.PayloadLength in (None, len(payload)):
+        return messageType.Decode(payload)
+    return payload
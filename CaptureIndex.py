@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from CaptureFile import CaptureFile
+from LNAV import LNAV_PAYLOAD_LENGTH
+from MultiplexedDecoder import _MessageId
+
+try:
+    import numpy as np
+except ImportError:
+    # Without numpy the index is sorted and filtered in pure Python, which is slower on large captures
+    np = None
+
+# TimeOfValidity stored for messages which don't have one (non-LNAV messages and those failing their checksum)
+NO_TIME = 0xFFFFFFFFFFFFFFFF
+
+# Index file header: magic, version, size of the capture file when it was indexed, offset to resume indexing from
+# and number of entries.  The header is followed by one little endian array per column.
+_MAGIC = b"MXIX"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIQQQ")
+
+# Column names and array type codes, in the order they are stored in the index file
+_COLUMNS = (
+    ("Offset", "Q"),
+    ("Length", "I"),
+    ("MessageId", "H"),
+    ("ChecksumOk", "B"),
+    ("TimeOfValidity", "Q"),
+)
+
+class CaptureIndex:
+    """
+    A Class which keeps a sidecar index of the messages in a multiplexed capture file, so that messages in a time
+    range or with particular message IDs can be found without decoding the whole capture.
+
+    The index is stored next to the capture (with ".idx" appended to its name by default).  If the capture has grown
+    since it was indexed, only the new data is scanned.
+
+    May be used as a context manager, which closes the capture file on exit.
+
+    Methods
+    -------
+    Update() indexes any data appended to the capture since it was last indexed
+
+    Query(start time, end time, message ids) returns a generator of CaptureFrame
+
+    Close()
+    """
+
+    def __init__(self, capturePath, indexPath=None):
+        self.__capturePath = capturePath
+        self.__indexPath = capturePath + ".idx" if indexPath is None else indexPath
+        self.__capture = None
+        self.__indexedSize = 0
+        self.__resumeOffset = 0
+        self.__columns = {name: array(typeCode) for name, typeCode in _COLUMNS}
+        self.__timeOrder = None
+
+        self.__Load()
+        self.Update()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.Close()
+
+    def __len__(self):
+        return len(self.__columns["Offset"])
+
+    def Close(self):
+        """
+        Close() closes the capture file.
+
+        Returns
+        -------
+        None.
+        """
+        if self.__capture is not None:
+            self.__capture.Close()
+            self.__capture = None
+
+    def __Load(self):
+        """
+        __Load reads the index file if there is one.  A missing, unreadable or out of date index is ignored, so the
+        capture is indexed from the start.
+
+        Returns
+        -------
+        None.
+        """
+        try:
+            with open(self.__indexPath, "rb") as f:
+                magic, version, indexedSize, resumeOffset, count = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC or version != _VERSION:
+                    return
+                columns = {}
+                for name, typeCode in _COLUMNS:
+                    column = array(typeCode)
+                    column.fromfile(f, count)
+                    if sys.byteorder == "big":
+                        column.byteswap()
+                    columns[name] = column
+        except (OSError, EOFError, struct.error):
+            return
+
+        # If the capture is now smaller than when it was indexed, then it has been replaced rather than appended to
+        if os.path.getsize(self.__capturePath) < indexedSize:
+            return
+
+        self.__columns = columns
+        self.__indexedSize = indexedSize
+        self.__resumeOffset = resumeOffset
+
+    def __Save(self):
+        """
+        __Save writes the index file.
+
+        Returns
+        -------
+        None.
+        """
+        tempPath = self.__indexPath + ".tmp"
+        with open(tempPath, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.__indexedSize, self.__resumeOffset, len(self)))
+            for name, typeCode in _COLUMNS:
+                column = self.__columns[name]
+                if sys.byteorder == "big":
+                    column = array(typeCode, column)
+                    column.byteswap()
+                column.tofile(f)
+        os.replace(tempPath, self.__indexPath)
+
+    def Update(self):
+        """
+        Update() indexes any data appended to the capture since it was last indexed, and saves the index file if it
+        has changed.
+
+        Returns
+        -------
+        None.
+        """
+        # Re-open the capture so that the mapping covers any data appended since it was opened
+        self.Close()
+        self.__capture = CaptureFile(self.__capturePath)
+        size = len(self.__capture)
+        if size == self.__indexedSize:
+            return
+
+        offsets = self.__columns["Offset"]
+        lengths = self.__columns["Length"]
+        messageIds = self.__columns["MessageId"]
+        checksumOks = self.__columns["ChecksumOk"]
+        times = self.__columns["TimeOfValidity"]
+
+        # The decoder is waiting for a DLE+STX after each complete message, so framing from the end of the last
+        # message gives the same result as framing the whole file again
+        for frame in self.__capture.RawFrames(self.__resumeOffset):
+            time = NO_TIME
+            if frame.ChecksumOk and frame.MessageId == _MessageId.LNAV.value and len(frame.Message) == LNAV_PAYLOAD_LENGTH + 3:
+                time = int.from_bytes(frame.Message[2:8], "little")
+
+            offsets.append(frame.Offset)
+            lengths.append(frame.Length)
+            messageIds.append(frame.MessageId)
+            checksumOks.append(frame.ChecksumOk)
+            times.append(time)
+            self.__resumeOffset = frame.Offset + frame.Length
+
+        self.__indexedSize = size
+        if np is None:
+            self.__timeOrder = None
+        self.__Save()
+
+    def __TimeOrder(self):
+        """
+        __TimeOrder returns the indices of the entries which have a TimeOfValidity, sorted by time, together with
+        their times.  Captures are normally already in time order, in which case no sort is needed.
+
+        Returns
+        -------
+        tuple of (array of entry indices, array of times)
+        """
+        if np is not None:
+            return self.__MergeTimeOrder()
+        if self.__timeOrder is None:
+            times = self.__columns["TimeOfValidity"]
+            order = array("L", (i for i in range(len(times)) if times[i] != NO_TIME))
+            sortedTimes = array("Q", (times[i] for i in order))
+            if any(sortedTimes[i] > sortedTimes[i + 1] for i in range(len(sortedTimes) - 1)):
+                order = array("L", sorted(order, key=times.__getitem__))
+                sortedTimes = array("Q", (times[i] for i in order))
+            self.__timeOrder = (order, sortedTimes)
+        return self.__timeOrder
+
+    def __MergeTimeOrder(self):
+        """
+        __MergeTimeOrder is __TimeOrder using numpy.  The order is kept up to date as the capture grows, by sorting only
+        the entries added since it was last worked out and merging them in.
+
+        Returns
+        -------
+        tuple of (numpy array of entry indices, numpy array of times)
+        """
+        times = self.__columns["TimeOfValidity"]
+        if self.__timeOrder is None:
+            self.__timeOrder = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64), 0)
+        order, sortedTimes, count = self.__timeOrder
+        if count == len(times):
+            return order, sortedTimes
+
+        # Copy the new times, as a view would stop the array being appended to
+        newTimes = np.frombuffer(times, dtype=np.uint64, offset=count * times.itemsize).copy()
+        newOrder = np.flatnonzero(newTimes != NO_TIME)
+        newTimes = newTimes[newOrder]
+        newOrder += count
+        if len(newTimes) > 1 and np.any(newTimes[1:] < newTimes[:-1]):
+            sort = np.argsort(newTimes, kind="stable")
+            newOrder, newTimes = newOrder[sort], newTimes[sort]
+
+        if len(sortedTimes) == 0 or len(newTimes) == 0 or newTimes[0] >= sortedTimes[-1]:
+            # Captures are normally in time order, so the new entries simply follow the old ones
+            order = np.concatenate((order, newOrder))
+            sortedTimes = np.concatenate((sortedTimes, newTimes))
+        else:
+            positions = np.searchsorted(sortedTimes, newTimes, side="right")
+            order = np.insert(order, positions, newOrder)
+            sortedTimes = np.insert(sortedTimes, positions, newTimes)
+
+        self.__timeOrder = (order, sortedTimes, len(times))
+        return order, sortedTimes
+
+    def __Matching(self, entries, messageIds):
+        """
+        __Matching filters entries down to those which passed their checksum and have one of the message IDs, using
+        numpy masks.
+
+        Parameters
+        ----------
+        entries : numpy array of entry indices, or None for every entry
+        messageIds : collection of message IDs, or None for all message IDs
+
+        Returns
+        -------
+        list of entry indices
+        """
+        # Copy the columns, as a view would stop them being appended to while the query is being read
+        checksumOks = np.array(self.__columns["ChecksumOk"], dtype=bool)
+        mask = checksumOks if entries is None else checksumOks[entries]
+        if messageIds is not None:
+            ids = np.frombuffer(self.__columns["MessageId"], dtype=np.uint16).copy()
+            mask &= np.isin(ids if entries is None else ids[entries], np.fromiter(messageIds, dtype=np.int64))
+        return (np.flatnonzero(mask) if entries is None else entries[mask]).tolist()
+
+    def Query(self, startTime=None, endTime=None, messageIds=None):
+        """
+        Query() finds messages using the index and decodes only those messages from the capture.
+
+        Parameters
+        ----------
+        startTime : earliest TimeOfValidity to return, or None.  If a start or end time is given, only messages with
+        a TimeOfValidity (LNAVs) are returned, in time order.
+        endTime : latest TimeOfValidity to return (inclusive), or None
+        messageIds : collection of message IDs to return, or None for all message IDs.  Without a time range,
+        messages are returned in file order.
+
+        Returns
+        -------
+        generator of CaptureFrame
+        """
+        checksumOks = self.__columns["ChecksumOk"]
+        ids = self.__columns["MessageId"]
+
+        if startTime is None and endTime is None:
+            entries = None if np is not None else range(len(self))
+        elif np is not None:
+            order, sortedTimes = self.__TimeOrder()
+            first = 0 if startTime is None else np.searchsorted(sortedTimes, startTime, side="left")
+            last = len(sortedTimes) if endTime is None else np.searchsorted(sortedTimes, endTime, side="right")
+            entries = order[first:last]
+        else:
+            order, sortedTimes = self.__TimeOrder()
+            first = 0 if startTime is None else bisect_left(sortedTimes, startTime)
+            last = len(sortedTimes) if endTime is None else bisect_right(sortedTimes, endTime)
+            entries = order[first:last]
+
+        if np is not None:
+            entries = self.__Matching(entries, messageIds)
+        else:
+            entries = [i for i in entries if checksumOks[i] and (messageIds is None or ids[i] in messageIds)]
+
+        for i in entries:
+            frame = self.__capture.ReadFrame(self.__columns["Offset"][i], self.__columns["Length"][i])
+            if frame is not None:
+                yield frame
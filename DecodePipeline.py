@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Decodes feeds on reader threads and runs the callbacks on a pool of worker threads, so that a slow callback never
+# holds up reading.  Each source is framed by its own MultiplexedDecoder on the thread feeding it, and the decoded
+# messages are passed to the workers through bounded queues.  Every source is handled by a single worker, so the
+# messages from a source are always delivered in the order they were received.
+
+import threading
+import traceback
+from collections import OrderedDict
+from enum import Enum
+from LNAV import LazyLNAV
+from MultiplexedDecoder import MultiplexedDecoder, _MessageId
+
+class DropPolicy(Enum):
+    """
+    Enum of what a DecodePipeline does with a decoded message when its queue is full
+    """
+    Block = 0        # wait for the worker to make room, holding up the source
+    DropOldest = 1   # drop the oldest queued message
+    DropNewest = 2   # drop the new message
+    KeepLatest = 3   # drop any queued message with the same source, message ID and callback, otherwise drop the oldest
+
+class _BoundedQueue:
+    """
+    A queue of (key, item) pairs with a maximum length and a DropPolicy, shared between threads.
+    """
+
+    def __init__(self, maxsize, policy):
+        self.__maxsize = maxsize
+        self.__policy = policy
+        # Maps each key to its item, oldest first
+        self.__items = OrderedDict()
+        self.__sequence = 0
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.Dropped = 0
+        self.MaxDepth = 0
+        self.Taken = 0
+
+    def __len__(self):
+        return len(self.__items)
+
+    def Put(self, key, item):
+        with self.__condition:
+            if self.__policy is DropPolicy.KeepLatest:
+                if self.__items.pop(key, None) is not None:
+                    # Drop the queued message and add the new one at the end, rather than overwriting the queued one,
+                    # so that the new message isn't delivered before older messages from the same source
+                    self.Dropped += 1
+            else:
+                # Other policies never replace a queued message, so give every message its own key
+                self.__sequence += 1
+                key = self.__sequence
+
+            if len(self.__items) >= self.__maxsize:
+                if self.__policy is DropPolicy.Block:
+                    while len(self.__items) >= self.__maxsize and not self.__closed:
+                        self.__condition.wait()
+                elif self.__policy is DropPolicy.DropNewest:
+                    self.Dropped += 1
+                    return
+                else:
+                    self.__items.popitem(last=False)
+                    self.Dropped += 1
+
+            self.__items[key] = item
+            if len(self.__items) > self.MaxDepth:
+                self.MaxDepth = len(self.__items)
+            self.__condition.notify_all()
+
+    def Get(self):
+        """
+        Get returns the next item, waiting for one if necessary, or None once the queue is closed and empty.
+        """
+        with self.__condition:
+            while not self.__items:
+                if self.__closed:
+                    return None
+                self.__condition.wait()
+            item = self.__items.popitem(last=False)[1]
+            self.Taken += 1
+            self.__condition.notify_all()
+            return item
+
+    def Close(self):
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+class DecodePipeline:
+    """
+    A Class which decodes any number of sources and passes the decoded messages to callbacks on worker threads.
+
+    Bytes can be passed in with Feed() from any thread, as long as each source is only fed from one thread at a time,
+    or AddReader() can start a reader thread for a source.  Callbacks are called with two parameters, the source and
+    the decoded message.
+
+    May be used as a context manager, which calls Close() on exit.
+
+    Methods
+    -------
+    AddLnavCallback(function, lazy)
+
+    Subscribe(message id, function, decode function)
+
+    Unsubscribe(message id, function)
+
+    Feed(source, byte array)
+
+    AddReader(source, read function)
+
+    GetStats() returns dictionary
+
+    Close()
+    """
+
+    def __init__(self, workers=1, maxsize=1024, policy=DropPolicy.Block):
+        """
+        Parameters
+        ----------
+        workers : number of callback worker threads
+        maxsize : maximum number of decoded messages waiting for each worker
+        policy : DropPolicy for when a worker's queue is full
+        """
+        self.__subscriptions = []
+        self.__decoders = {}
+        # Maps (source, message ID, callback) to the function subscribed to that source's decoder
+        self.__wrappers = {}
+        self.__lock = threading.Lock()
+        self.__queues = [_BoundedQueue(maxsize, policy) for i in range(workers)]
+        self.__readers = []
+        self.__callbackErrors = 0
+        self.__workers = [threading.Thread(target=self.__Work, args=(queue,), daemon=True) for queue in self.__queues]
+        for worker in self.__workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.Close()
+
+    def AddLnavCallback(self, func, lazy=False):
+        """
+        AddLnavCallback
+
+        Parameters
+        ----------
+        func : function - A callback to be called on a worker thread when an LNAV message is decoded.  The callback
+        takes two parameters, the source and an LNAV object.
+        lazy : if True the callback is passed a LazyLNAV, which only decodes the fields that are read
+
+        Returns
+        -------
+        None.
+        """
+        self.Subscribe(_MessageId.LNAV.value, func, LazyLNAV if lazy else None)
+
+    def Subscribe(self, messageId, func, decode=None):
+        """
+        Subscribe
+
+        Parameters
+        ----------
+        messageId : ID of the messages wanted
+        func : function - A callback to be called on a worker thread when a message with this ID passes its checksum.
+        The callback takes two parameters, the source and the decoded message.
+        decode : function to decode the payload bytes with instead of the registered one, or None
+
+        Returns
+        -------
+        None.
+        """
+        with self.__lock:
+            self.__subscriptions.append((messageId, func, decode))
+            for source, (decoder, queue) in self.__decoders.items():
+                self.__SubscribeDecoder(decoder, queue, source, messageId, func, decode)
+
+    def Unsubscribe(self, messageId, func):
+        """
+        Unsubscribe.  Messages already queued for the callback are still passed to it.
+
+        Parameters
+        ----------
+        messageId : ID the callback was subscribed to
+        func : function - the callback to remove
+
+        Returns
+        -------
+        None.
+        """
+        with self.__lock:
+            self.__subscriptions = [subscription for subscription in self.__subscriptions
+                                    if subscription[0] != messageId or subscription[1] != func]
+            for source, (decoder, queue) in self.__decoders.items():
+                wrapper = self.__wrappers.pop((source, messageId, func), None)
+                if wrapper is not None:
+                    decoder.Unsubscribe(messageId, wrapper)
+
+    def __SubscribeDecoder(self, decoder, queue, source, messageId, func, decode):
+        # The decoder may be decoding on a reader thread, which is safe as MultiplexedDecoder swaps in a new list of
+        # subscribers rather than changing the one it is using
+        key = (source, messageId, func)
+        wrapper = self.__wrappers[key] = lambda message: queue.Put(key, (func, source, message))
+        decoder.Subscribe(messageId, wrapper, decode)
+
+    def __Decoder(self, source):
+        """
+        __Decoder returns the decoder and queue for a source, setting them up the first time the source is seen.
+        Sources are shared out between the workers in turn.
+        """
+        entry = self.__decoders.get(source)
+        if entry is None:
+            with self.__lock:
+                entry = self.__decoders.get(source)
+                if entry is None:
+                    decoder = MultiplexedDecoder()
+                    queue = self.__queues[len(self.__decoders) % len(self.__queues)]
+                    for messageId, func, decode in self.__subscriptions:
+                        self.__SubscribeDecoder(decoder, queue, source, messageId, func, decode)
+                    entry = self.__decoders[source] = (decoder, queue)
+        return entry
+
+    def Feed(self, source, multiplexedBytes):
+        """
+        Feed() decodes bytes received from a source, and queues the decoded messages for the workers.
+
+        Parameters
+        ----------
+        source : any hashable value identifying where the bytes came from
+        multiplexedBytes : byte array
+
+        Returns
+        -------
+        None.
+        """
+        self.__Decoder(source)[0].DecodeBytes(multiplexedBytes)
+
+    def AddReader(self, source, read):
+        """
+        AddReader() starts a thread which reads a source and feeds it to the pipeline until read returns no bytes.
+
+        Parameters
+        ----------
+        source : any hashable value identifying the source
+        read : function taking no parameters which returns the next bytes from the source, such as
+        functools.partial(socket.recv, 4096) or serial.read
+
+        Returns
+        -------
+        threading.Thread : the reader thread
+        """
+        def Read():
+            while True:
+                data = read()
+                if not data:
+                    break
+                self.Feed(source, data)
+
+        reader = threading.Thread(target=Read, daemon=True)
+        self.__readers.append(reader)
+        reader.start()
+        return reader
+
+    def __Work(self, queue):
+        while True:
+            item = queue.Get()
+            if item is None:
+                return
+            func, source, message = item
+            try:
+                func(source, message)
+            except Exception:
+                with self.__lock:
+                    self.__callbackErrors += 1
+                traceback.print_exc()
+
+    def GetStats(self):
+        """
+        GetStats
+
+        Returns
+        -------
+        dictionary : QueueDepth (messages waiting for the workers), MaxQueueDepth (largest depth seen by any one
+        worker's queue), Dropped (messages dropped by the DropPolicy), Delivered (messages passed to callbacks),
+        CallbackErrors (callbacks which raised an exception) and Sources (number of sources seen)
+        """
+        return {
+            "QueueDepth": sum(len(queue) for queue in self.__queues),
+            "MaxQueueDepth": max(queue.MaxDepth for queue in self.__queues),
+            "Dropped": sum(queue.Dropped for queue in self.__queues),
+            "Delivered": sum(queue.Taken for queue in self.__queues),
+            "CallbackErrors": self.__callbackErrors,
+            "Sources": len(self.__decoders),
+        }
+
+    def Close(self, timeout=None):
+        """
+        Close() waits for the reader threads to reach the end of their sources, then stops the workers once they have
+        delivered every queued message.
+
+        Parameters
+        ----------
+        timeout : maximum time in seconds to wait for each thread, or None to wait for as long as it takes
+
+        Returns
+        -------
+        None.
+        """
+        for reader in self.__readers:
+            reader.join(timeout)
+        for queue in self.__queues:
+            queue.Close()
+        for worker in self.__workers:
+            worker.join(timeout)
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from LNAV import LazyLNAV
+from LnavFilter import LnavFilter
+from MultiplexedDecoder import MultiplexedDecoder, _FramingState, _MessageId
+
+# Marks that no source's framing state is loaded into the shared decoder
+_NO_SOURCE = object()
+
+class DecoderPool:
+    """
+    A Class which decodes many streams, keyed by source.  All of the sources share one MultiplexedDecoder, and so
+    share its subscriptions, message buffer and statistics.  Each source only keeps a small _FramingState, which is
+    swapped into the shared decoder when bytes arrive from that source.  Callbacks are called with two parameters, the
+    source and the decoded message.
+
+    Methods
+    -------
+    DecodeBytes(source, byte array)
+
+    DecodeMany(list of (source, byte array) tuples)
+
+    AddLnavCallback(function, lazy, predicate, predicate factory)
+
+    Subscribe(message id, function, decode function, predicate, in place, predicate factory)
+
+    Unsubscribe(message id, function)
+
+    AddFrameCallback(function)
+
+    RemoveSource(source)
+
+    EnableStats(True to record latency histograms), DisableStats(), GetStats() returns dictionary, ResetStats()
+
+    EnableRecovery(), DisableRecovery()
+    """
+
+    def __init__(self):
+        self.__decoder = MultiplexedDecoder()
+        self.__states = {}
+        self.__source = _NO_SOURCE
+        # Maps (message ID, callback) to the wrapper which adds the source
+        self.__wrappers = {}
+        # Maps (message ID, callback) to a dictionary of each source's predicate, for subscriptions with a factory
+        self.__sourcePredicates = {}
+        self.__LnavCallback = None
+
+    def __len__(self):
+        return len(self.__states)
+
+    def __Load(self, source):
+        """
+        __Load swaps the framing state of source into the shared decoder, saving the state of the previous source.
+        """
+        if self.__source is not _NO_SOURCE:
+            self.__decoder._SaveState(self.__states[self.__source])
+        state = self.__states.get(source)
+        if state is None:
+            state = self.__states[source] = _FramingState()
+        self.__decoder._LoadState(state)
+        self.__source = source
+
+    def DecodeBytes(self, source, multiplexedBytes):
+        """
+        DecodeBytes decodes bytes received from one source.  See MultiplexedDecoder.DecodeBytes.
+
+        Parameters
+        ----------
+        source : any hashable value identifying where the bytes came from
+        multiplexedBytes : byte array - bytes to be decoded.
+
+        Returns
+        -------
+        None.
+        """
+        if source != self.__source or self.__source is _NO_SOURCE:
+            self.__Load(source)
+        self.__decoder.DecodeBytes(multiplexedBytes)
+
+    def DecodeMany(self, chunks):
+        """
+        DecodeMany decodes a batch of chunks from any number of sources.  The chunks from each source are joined and
+        decoded together, so each source's state is only swapped in once per call.  Messages from each source are
+        passed to the callbacks in order, but messages from different sources may not be interleaved as they arrived.
+
+        Parameters
+        ----------
+        chunks : iterable of (source, byte array) tuples
+
+        Returns
+        -------
+        None.
+        """
+        bySource = {}
+        for source, chunk in chunks:
+            pieces = bySource.get(source)
+            if pieces is None:
+                bySource[source] = [chunk]
+            else:
+                pieces.append(chunk)
+
+        for source, pieces in bySource.items():
+            self.DecodeBytes(source, pieces[0] if len(pieces) == 1 else b"".join(pieces))
+
+    def RemoveSource(self, source):
+        """
+        RemoveSource forgets a source's framing state, such as when its connection closes.
+
+        Parameters
+        ----------
+        source : the source to forget
+
+        Returns
+        -------
+        None.
+        """
+        if source == self.__source and self.__source is not _NO_SOURCE:
+            # Leave the shared decoder with an empty state rather than the removed source's
+            self.__decoder._LoadState(_FramingState())
+            self.__source = _NO_SOURCE
+        self.__states.pop(source, None)
+        for predicates in self.__sourcePredicates.values():
+            predicates.pop(source, None)
+
+    def __CurrentSource(self):
+        return self.__source
+
+    def AddLnavCallback(self, func, lazy=False, predicate=None, predicateFactory=None):
+        """
+        AddLnavCallback
+
+        Parameters
+        ----------
+        func : function - A callback to be called when an LNAV message is decoded.  The callback takes two
+        parameters, the source and an LNAV object.  This replaces any callback previously added with
+        AddLnavCallback; use Subscribe() to add more than one.
+        lazy : if True the callback is passed a LazyLNAV, which only decodes the fields that are read
+        predicate : function which decides from the raw message whether to decode it, or None.  See Subscribe().
+        predicateFactory : function which returns a new predicate for each source, or None.  See Subscribe().
+
+        Returns
+        -------
+        None.
+        """
+        if self.__LnavCallback is not None:
+            self.Unsubscribe(_MessageId.LNAV.value, self.__LnavCallback)
+        self.__LnavCallback = func
+        if func is not None:
+            self.Subscribe(_MessageId.LNAV.value, func, LazyLNAV if lazy else None, predicate,
+                           predicateFactory=predicateFactory)
+
+    def Subscribe(self, messageId, func, decode=None, predicate=None, inPlace=False, predicateFactory=None):
+        """
+        Subscribe.  See MultiplexedDecoder.Subscribe.
+
+        Parameters
+        ----------
+        messageId : ID of the messages wanted
+        func : function - A callback to be called when a message with this ID passes its checksum.  The callback takes
+        two parameters, the source and the decoded message.
+        decode : function to decode the payload bytes with instead of the registered one, or None
+        predicate : function which decides from the raw message whether to decode it, or None.  It sees the messages
+        from every source, so it must not keep any state - an LnavFilter which decimates is refused.
+        inPlace : if True, decode is called with (buffer, offset) rather than a copy of the payload
+        predicateFactory : function taking no parameters which returns a new predicate, or None.  It is called the
+        first time each source sends a message with this ID, so that each source is filtered separately - for
+        example functools.partial(LnavFilter, every=100) passes one LNAV in 100 from every source.
+
+        Returns
+        -------
+        None.
+        """
+        if predicate is not None and predicateFactory is not None:
+            raise ValueError("predicate and predicateFactory can't be used together")
+        if isinstance(predicate, LnavFilter) and predicate.Decimates:
+            raise ValueError("a decimating LnavFilter would thin out all the sources together - use predicateFactory")
+
+        currentSource = self.__CurrentSource
+        if predicateFactory is not None:
+            predicates = self.__sourcePredicates[(messageId, func)] = {}
+
+            def predicate(buffer, offset):
+                source = currentSource()
+                sourcePredicate = predicates.get(source)
+                if sourcePredicate is None:
+                    sourcePredicate = predicates[source] = predicateFactory()
+                return sourcePredicate(buffer, offset)
+
+        wrapper = lambda message: func(currentSource(), message)
+        self.__wrappers[(messageId, func)] = wrapper
+        self.__decoder.Subscribe(messageId, wrapper, decode, predicate, inPlace)
+
+    def Unsubscribe(self, messageId, func):
+        """
+        Unsubscribe
+
+        Parameters
+        ----------
+        messageId : ID the callback was subscribed to
+        func : function - the callback to remove
+
+        Returns
+        -------
+        None.
+        """
+        self.__sourcePredicates.pop((messageId, func), None)
+        wrapper = self.__wrappers.pop((messageId, func), None)
+        if wrapper is not None:
+            self.__decoder.Unsubscribe(messageId, wrapper)
+
+    def AddFrameCallback(self, func):
+        """
+        AddFrameCallback
+
+        Parameters
+        ----------
+        func : function - A callback to be called for every complete message received.  The callback takes two
+        parameters, the source and a Frame, whose Offset is the position in that source's stream
+
+        Returns
+        -------
+        None.
+        """
+        if func is None:
+            self.__decoder.AddFrameCallback(None)
+        else:
+            currentSource = self.__CurrentSource
+            self.__decoder.AddFrameCallback(lambda frame: func(currentSource(), frame))
+
+    def EnableRecovery(self):
+        """
+        EnableRecovery turns on recovery mode for all sources.  See MultiplexedDecoder.EnableRecovery.
+        """
+        self.__decoder.EnableRecovery()
+
+    def DisableRecovery(self):
+        """
+        DisableRecovery turns off recovery mode.
+        """
+        self.__decoder.DisableRecovery()
+
+    def EnableStats(self, latency=False):
+        """
+        EnableStats starts counting, totalled over all sources.  See MultiplexedDecoder.EnableStats.
+        """
+        self.__decoder.EnableStats(latency)
+
+    def DisableStats(self):
+        """
+        DisableStats stops counting.
+        """
+        self.__decoder.DisableStats()
+
+    def GetStats(self):
+        """
+        GetStats
+
+        Returns
+        -------
+        dictionary : a snapshot of the counters totalled over all sources (see DecoderStats), or None if statistics
+        are not enabled
+        """
+        stats = self.__decoder.GetStats()
+        if stats is not None:
+            # The shared decoder only knows about the partial message of the source currently loaded
+            pending = 0
+            for source, state in self.__states.items():
+                if source != self.__source:
+                    if state.InMessage:
+                        pending += state.StreamOffset - state.MessageOffset
+                    elif state.DleReceived:
+                        pending += 1
+            stats["BytesDiscarded"] = max(0, stats["BytesDiscarded"] - pending)
+        return stats
+
+    def ResetStats(self):
+        """
+        ResetStats sets all the counters to zero.
+        """
+        self.__decoder.ResetStats()
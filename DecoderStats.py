@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Number of histogram buckets - bucket n counts durations of 2^(n-1) to 2^n - 1 nanoseconds
+_BUCKETS = 40
+
+class LatencyHistogram:
+    """
+    A Class which records durations in nanoseconds into power of two buckets, so recording is cheap and the memory
+    used is fixed however many durations are recorded.
+
+    Methods
+    -------
+    Record(nanoseconds)
+
+    Snapshot() returns dictionary
+
+    Reset()
+    """
+    __slots__ = ("__buckets", "__count", "__total", "__max")
+
+    def __init__(self):
+        self.Reset()
+
+    def Record(self, nanoseconds):
+        """
+        Record() adds a duration to the histogram.
+
+        Parameters
+        ----------
+        nanoseconds : the duration
+
+        Returns
+        -------
+        None.
+        """
+        self.__buckets[min(nanoseconds.bit_length(), _BUCKETS - 1)] += 1
+        self.__count += 1
+        self.__total += nanoseconds
+        if nanoseconds > self.__max:
+            self.__max = nanoseconds
+
+    def Percentile(self, percent):
+        """
+        Percentile() estimates a percentile of the recorded durations.  The estimate is the upper limit of the bucket
+        the percentile falls in, so may be up to twice the true value.
+
+        Parameters
+        ----------
+        percent : the percentile wanted (0 to 100)
+
+        Returns
+        -------
+        integer : duration in nanoseconds, or 0 if nothing has been recorded
+        """
+        if self.__count == 0:
+            return 0
+        target = self.__count * percent / 100.0
+        seen = 0
+        for bucket, count in enumerate(self.__buckets):
+            seen += count
+            if seen >= target and count:
+                return min((1 << bucket) - 1, self.__max)
+        return self.__max
+
+    def Snapshot(self):
+        """
+        Snapshot() returns the current state of the histogram.
+
+        Returns
+        -------
+        dictionary : Count, MeanNs, MaxNs, P50Ns, P99Ns and Buckets (a list of counts, where bucket n counts
+        durations of 2^(n-1) to 2^n - 1 nanoseconds)
+        """
+        return {
+            "Count": self.__count,
+            "MeanNs": self.__total / self.__count if self.__count else 0.0,
+            "MaxNs": self.__max,
+            "P50Ns": self.Percentile(50),
+            "P99Ns": self.Percentile(99),
+            "Buckets": list(self.__buckets),
+        }
+
+    def Reset(self):
+        """
+        Reset() clears the histogram.
+
+        Returns
+        -------
+        None.
+        """
+        self.__buckets = [0] * _BUCKETS
+        self.__count = 0
+        self.__total = 0
+        self.__max = 0
+
+class DecoderStats:
+    """
+    Counters kept by a MultiplexedDecoder while statistics are enabled.  The decoder updates the counters directly;
+    use MultiplexedDecoder.GetStats() to read them.
+
+    Counters
+    --------
+    BytesIn : bytes passed to the decoder
+    Frames : complete messages (DLE+STX to DLE+ETX) received
+    FramesDecoded : messages decoded and passed to subscribers
+    FramesRecovered : messages found inside a message which failed its checks, in recovery mode (these are also
+    counted in FramesDecoded)
+    FramesSkipped : messages skipped because nothing is subscribed to their message ID
+    FramesFiltered : messages which passed their checks but were rejected by the predicates of all their subscribers
+    (these are also counted in FramesDecoded)
+    ChecksumErrors : messages dropped because their checksum failed
+    LengthErrors : messages dropped because they were the wrong length for their message ID
+    Overflows : partial messages dropped because they grew too long without a DLE+ETX
+    Resyncs : partial messages dropped because of a DLE which wasn't followed by STX, ETX or DLE
+    BytesAccepted : stream bytes making up decoded and skipped messages
+
+    DecodeLatency and CallbackLatency are LatencyHistograms of the time taken to checksum and decode each message and
+    to run its callbacks, or None if latency isn't being recorded.
+    """
+    __slots__ = ("BytesIn", "Frames", "FramesDecoded", "FramesRecovered", "FramesSkipped", "FramesFiltered",
+                 "ChecksumErrors", "LengthErrors", "Overflows", "Resyncs", "BytesAccepted", "DecodeLatency",
+                 "CallbackLatency")
+
+    def __init__(self, latency=False):
+        self.DecodeLatency = LatencyHistogram() if latency else None
+        self.CallbackLatency = LatencyHistogram() if latency else None
+        self.Reset()
+
+    def Reset(self):
+        """
+        Reset() sets all the counters to zero and clears the latency histograms.
+
+        Returns
+        -------
+        None.
+        """
+        self.BytesIn = 0
+        self.Frames = 0
+        self.FramesDecoded = 0
+        self.FramesRecovered = 0
+        self.FramesSkipped = 0
+        self.FramesFiltered = 0
+        self.ChecksumErrors = 0
+        self.LengthErrors = 0
+        self.Overflows = 0
+        self.Resyncs = 0
+        self.BytesAccepted = 0
+        if self.DecodeLatency is not None:
+            self.DecodeLatency.Reset()
+            self.CallbackLatency.Reset()
+
+    def Snapshot(self, bytesPending=0):
+        """
+        Snapshot() returns a copy of the counters.
+
+        Parameters
+        ----------
+        bytesPending : bytes of a partly received message which the decoder is still holding
+
+        Returns
+        -------
+        dictionary : each counter by name, plus BytesDiscarded (bytes which weren't part of a decoded or skipped
+        message, such as noise between messages and dropped messages), and DecodeLatency and CallbackLatency
+        histogram snapshots if latency is being recorded
+        """
+        snapshot = {name: getattr(self, name) for name in self.__slots__ if not name.endswith("Latency")}
+        # A message which started before the statistics were reset can make this briefly negative
+        snapshot["BytesDiscarded"] = max(0, self.BytesIn - self.BytesAccepted - bytesPending)
+        if self.DecodeLatency is not None:
+            snapshot["DecodeLatency"] = self.DecodeLatency.Snapshot()
+            snapshot["CallbackLatency"] = self.CallbackLatency.Snapshot()
+        return snapshot
@@ -32,14 +32,13 @@ testMessage = bytearray([0x10, 0x02, 0x00, 0xe0, 0xe9, 0x22, 0x64, 0x39, 0x00, 0
                          0x00, 0x00, 0xa8, 0x41, 0x00, 0x00, 0x7a, 0x10, 0x03 
 ])
     
-# Create a multiplexed decoder
-multiplexedDecoder = md.MultiplexedDecoder()
-
-# Give the deocoder a callback for when an LNAV message has been decoded
-multiplexedDecoder.AddLnavCallback(LnavReceived)
-
-# Pass the received bytes to the decoder - the MultiplexDecoder class keeps a bufer of bytes received so far
-# so bytes may be passed to the multiplex decoder as they arrive, and will be kept until they form a valid messaage
-multiplexedDecoder.DecodeBytes(testMessage)
+if __name__ == "__main__":
+    # Create a multiplexed decoder
+    multiplexedDecoder = md.MultiplexedDecoder()
 
+    # Give the deocoder a callback for when an LNAV message has been decoded
+    multiplexedDecoder.AddLnavCallback(LnavReceived)
 
+    # Pass the received bytes to the decoder - the MultiplexDecoder class keeps a bufer of bytes received so far
+    # so bytes may be passed to the multiplex decoder as they arrive, and will be kept until they form a valid messaage
+    multiplexedDecoder.DecodeBytes(testMessage)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Encodes LNAV messages with MultiplexedEncoder and checks that MultiplexedDecoder decodes them back to the same
+# values.
+
+import time
+import MultiplexedDecoder as md
+from ExampleLnavDecoder import testMessage
+from LNAV import LNAV
+from MultiplexedEncoder import MultiplexedEncoder
+from SyntheticStream import GenerateStream
+
+encoder = MultiplexedEncoder()
+
+# Decode the sample message from ExampleLnavDecoder.py, then encode it again - it should come back byte for byte
+decoded = []
+decoder = md.MultiplexedDecoder()
+decoder.AddLnavCallback(decoded.append)
+decoder.DecodeBytes(testMessage)
+assert encoder.EncodeLnav(decoded[0]) == bytes(testMessage)
+print("Sample message round trip OK")
+
+# Round trip a stream of random LNAVs (with plenty of DLEs to escape).  Each LNAV is set up with the values it
+# decodes to, and encoding those values must give back the original payload.
+stream, payloads = GenerateStream(10000, seed=1, dleDensity=0.05)
+lnavs = [LNAV.Decode(payload) for payload in payloads]
+lnavs = [lnav for lnav in lnavs if all(value == value for value in vars(lnav).values())]
+
+start = time.perf_counter()
+encoded = encoder.EncodeLnavBatch(lnavs)
+elapsed = time.perf_counter() - start
+print("Encoded {} LNAVs at {:.0f} frames/s".format(len(lnavs), len(lnavs) / elapsed))
+
+decoded = []
+decoder = md.MultiplexedDecoder()
+decoder.AddLnavCallback(decoded.append)
+decoder.DecodeBytes(encoded)
+assert [lnav.Encode() for lnav in decoded] == [lnav.Encode() for lnav in lnavs]
+assert [vars(lnav) for lnav in decoded] == [vars(lnav) for lnav in lnavs]
+print("Stream round trip OK")
+
+# The array form of the batch encoder should give exactly the same bytes
+try:
+    columns = LNAV.DecodeBatch([lnav.Encode() for lnav in lnavs])
+except ImportError:
+    print("Array round trip skipped - numpy is not installed")
+else:
+    start = time.perf_counter()
+    encodedArrays = encoder.EncodeLnavBatch(columns)
+    elapsed = time.perf_counter() - start
+    assert encodedArrays == encoded
+    print("Array round trip OK, encoded at {:.0f} frames/s".format(len(lnavs) / elapsed))
+
+
+# Values which don't fit their fields must be refused by both encoders, rather than wrapping round to a different value
+def Refused(encode, lnavs):
+    try:
+        encode(lnavs)
+    except ValueError:
+        return True
+    return False
+
+for name, value in (("LatitudeDegrees", 90.0), ("VelocityNorthMetresPerSecond", 40.0), ("StatusFlags", 1 << 16)):
+    outOfRange = LNAV.Decode(lnavs[0].Encode())
+    setattr(outOfRange, name, value)
+    assert Refused(encoder.EncodeLnavBatch, [outOfRange])
+    try:
+        columns = {key: [item] for key, item in vars(outOfRange).items()}
+        assert Refused(encoder.EncodeLnavBatch, columns)
+    except ImportError:
+        pass
+print("Out of range values refused OK")
@@ -17,6 +17,12 @@
 import struct
 from enum import Enum
 
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for the batch decoding functions
+    np = None
+
 class StatusFlags(Enum):
     """
     Enum contining the bit numbers of the Status Flags for the LNAV message
@@ -37,6 +43,94 @@ class StatusFlags(Enum):
     USBL_NotUsed = 13,
     Euler = 14
 
+# Length of an LNAV payload in bytes
+LNAV_PAYLOAD_LENGTH = 90
+
+# Layout of the LNAV payload after the 48 bit TimeOfValidity.  Each entry holds the property name, the byte offset
+# of the field, its struct format character (little endian) and the multiplier and divisor used to scale the raw
+# value into engineering units.  Float fields are not scaled, so have a multiplier and divisor of None.
+_FIELDS = (
+    ("LatitudeDegrees", 6, "i", 90.0, 1 << 31),
+    ("LongitudeDegrees", 10, "i", 180.0, 1 << 31),
+    ("DepthMetres", 14, "i", 1, 1e3),
+    ("AltitudeMetres", 18, "H", 1, 1e2),
+    ("RollDegrees", 20, "h", 180.0, 1 << 15),
+    ("PitchDegrees", 22, "h", 180.0, 1 << 15),
+    ("HeadingDegrees", 24, "H", 180.0, 1 << 15),
+    ("VelocityNorthMetresPerSecond", 26, "h", 1, 1e3),
+    ("VelocityEastMetresPerSecond", 28, "h", 1, 1e3),
+    ("VelocityDownMetresPerSecond", 30, "h", 1, 1e3),
+    ("AngularRateForwardDegreesPerSecond", 32, "h", 1, 1e2),
+    ("AngularRateStarboardDegreesPerSecond", 34, "h", 1, 1e2),
+    ("AngularRateDownDegreesPerSecond", 36, "h", 1, 1e2),
+    ("AccelerationForwardMetresPerSecondPerSecond", 38, "h", 1, 1e3),
+    ("AccelerationStarboardMetresPerSecondPerSecond", 40, "h", 1, 1e3),
+    ("AccelerationDownMetresPerSecondPerSecond", 42, "h", 1, 1e3),
+    ("HorizontalPositionErrorSemiMajorMetres", 44, "f", None, None),
+    ("HorizontalPositionErrorSemiMinorMetres", 48, "f", None, None),
+    ("HorizontalPositionErrorSemiMajorDirectionDegrees", 52, "f", None, None),
+    ("VerticalPositionErrorMetres", 56, "f", None, None),
+    ("LevelErrorNorthDegrees", 60, "f", None, None),
+    ("LevelErrorEastDegrees", 64, "f", None, None),
+    ("ErrorHeadingDegrees", 68, "f", None, None),
+    ("HorizontalVelocityErrorSemiMajorMetresPerSecond", 72, "f", None, None),
+    ("HorizontalVelocityErrorSemiMinorMetresPerSecond", 76, "f", None, None),
+    ("HorizontalVelocityErrorSemiMajorDirectionDegrees", 80, "f", None, None),
+    ("VerticalVelocityErrorMetresPerSecond", 84, "f", None, None),
+    ("StatusFlags", 88, "H", None, None),
+)
+
+# The whole payload, for encoding
+_PAYLOAD_STRUCT = struct.Struct("<IH" + "".join(field[2] for field in _FIELDS))
+
+# (index in the values unpacked by _PAYLOAD_STRUCT, name, multiplier, divisor) for each field, used by DecodeInto
+_RECORD_FIELDS = [(index + 2, field[0], field[3], field[4]) for index, field in enumerate(_FIELDS)]
+
+# numpy type codes for the struct format characters used in _FIELDS
+_NUMPY_TYPES = {"i": "<i4", "H": "<u2", "h": "<i2", "f": "<f4"}
+
+def _StatusBit(statusFlag):
+    """
+    _StatusBit returns the bit number of a StatusFlags value.  Most of the values are 1-tuples, but not all.
+    """
+    return statusFlag.value[0] if isinstance(statusFlag.value, tuple) else statusFlag.value
+
+def _BatchDtype():
+    """
+    _BatchDtype builds a packed little endian numpy structured dtype which overlays a raw LNAV payload.  The 48 bit
+    TimeOfValidity is split into a 32 bit low word and a 16 bit high word.
+
+    Returns
+    -------
+    numpy dtype : the payload layout
+    """
+    names = ["TimeOfValidityLow", "TimeOfValidityHigh"]
+    formats = ["<u4", "<u2"]
+    offsets = [0, 4]
+    for name, offset, fmt, multiplier, divisor in _FIELDS:
+        names.append(name)
+        formats.append(_NUMPY_TYPES[fmt])
+        offsets.append(offset)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": LNAV_PAYLOAD_LENGTH})
+
+def _OutOfRangeField(lnav):
+    """
+    _OutOfRangeField finds which property of an LNAV object can't be encoded, to report why Encode() failed.
+
+    Returns
+    -------
+    string : the name of the first property which is out of range
+    """
+    if not 0 <= lnav.TimeOfValidity < 1 << 48:
+        return "TimeOfValidity"
+    for name, offset, fmt, multiplier, divisor in _FIELDS:
+        try:
+            value = getattr(lnav, name)
+            struct.pack("<" + fmt, value if multiplier is None else round(value * divisor / multiplier))
+        except (struct.error, OverflowError, ValueError):
+            return name
+    return "value"
+
 class LNAV:
     """
     Class to decode LNAV messages
@@ -76,6 +170,12 @@ class LNAV:
     Methods
     -------
     (static) Decode(byte array) returns LNAV object
+    (static) DecodeInto(byte array, record, offset) returns record
+    (static) RecordDtype() returns numpy dtype
+    (static) DecodeBatch(byte array or list of byte arrays) returns dictionary of numpy arrays
+    (static) GetStatusBatch(numpy array, StatusFlags) returns numpy boolean array
+    (static) EncodeBatch(dictionary of arrays) returns numpy structured array
+    Encode() returns byte array
     GetStatus(StatusFlags) returns bool
     ToString() returns string
     
@@ -200,6 +300,165 @@ class LNAV:
 
         return lnav
 
+    def DecodeInto(message, record, offset=0):
+        """
+        DecodeInto() decodes LNAV data into an existing record instead of creating a new LNAV object, so that a
+        decoder running at a high rate can reuse the same record for every message.
+
+        Parameters
+        ----------
+        message : byte array to decode
+        record : where to put the values - an LNAV object (or any object the properties can be set on), or a row of a
+        numpy structured array with a field for each LNAV property, such as one with the dtype from RecordDtype()
+        offset : index of the start of the LNAV payload in message, so that it can be decoded without being copied out
+
+        Returns
+        -------
+        record : the record passed in
+        """
+        values = _PAYLOAD_STRUCT.unpack_from(message, offset)
+        if np is not None and isinstance(record, (np.void, np.ndarray)):
+            record["TimeOfValidity"] = values[0] | (values[1] << 32)
+            for index, name, multiplier, divisor in _RECORD_FIELDS:
+                record[name] = values[index] if multiplier is None else values[index] * multiplier / divisor
+        else:
+            record.TimeOfValidity = values[0] | (values[1] << 32)
+            for index, name, multiplier, divisor in _RECORD_FIELDS:
+                setattr(record, name, values[index] if multiplier is None else values[index] * multiplier / divisor)
+        return record
+
+    def RecordDtype():
+        """
+        RecordDtype() returns a numpy structured dtype with a field for each LNAV property, holding the values as
+        DecodeBatch() returns them.  An array of this dtype can be filled one row at a time with DecodeInto().
+        Requires numpy.
+
+        Returns
+        -------
+        numpy dtype
+        """
+        if np is None:
+            raise ImportError("LNAV.RecordDtype requires numpy")
+
+        return np.dtype([("TimeOfValidity", np.uint64)] +
+                        [(name, np.uint16 if name == "StatusFlags" else np.float64) for name, offset, fmt, multiplier, divisor in _FIELDS])
+
+    def DecodeBatch(payloads):
+        """
+        DecodeBatch() decodes many LNAV payloads at once into columns of numpy arrays.  This is much faster than
+        calling Decode() for each payload when post-processing large amounts of data.  Requires numpy.
+
+        Parameters
+        ----------
+        payloads : either a byte array containing LNAV payloads packed back to back (its length must be a multiple
+        of 90 bytes), or a list of 90 byte LNAV payloads
+
+        Returns
+        -------
+        dictionary : maps each LNAV property name to a numpy array with one element per payload.  TimeOfValidity
+        and StatusFlags are integer arrays, all other fields are float64 arrays scaled as in Decode()
+        """
+        if np is None:
+            raise ImportError("LNAV.DecodeBatch requires numpy")
+
+        if isinstance(payloads, (list, tuple)):
+            payloads = b"".join(payloads)
+        if len(payloads) % LNAV_PAYLOAD_LENGTH != 0:
+            raise ValueError("LNAV payload buffer length {} is not a multiple of {}".format(len(payloads), LNAV_PAYLOAD_LENGTH))
+
+        raw = np.frombuffer(payloads, dtype=_BatchDtype())
+        columns = {}
+        columns["TimeOfValidity"] = raw["TimeOfValidityLow"].astype(np.uint64) | (raw["TimeOfValidityHigh"].astype(np.uint64) << np.uint64(32))
+        for name, offset, fmt, multiplier, divisor in _FIELDS:
+            if name == "StatusFlags":
+                columns[name] = raw[name].astype(np.uint16)
+            elif multiplier is None:
+                # Widening a signalling NaN sets the invalid flag, but the value is still a NaN as Decode() gives
+                with np.errstate(invalid="ignore"):
+                    columns[name] = raw[name].astype(np.float64)
+            else:
+                columns[name] = raw[name].astype(np.float64) * multiplier / divisor
+        return columns
+
+    def GetStatusBatch(statusFlags, statusFlag):
+        """
+        GetStatusBatch() is the batch equivalent of GetStatus(), testing one status bit across a whole array of
+        StatusFlags values such as the one returned by DecodeBatch().  Requires numpy.
+
+        Parameters
+        ----------
+        statusFlags : numpy integer array of StatusFlags values
+        statusFlag : StatusFlags enum value
+
+        Returns
+        -------
+        numpy boolean array : state of corresponding status bit for each element of statusFlags
+        """
+        if np is None:
+            raise ImportError("LNAV.GetStatusBatch requires numpy")
+
+        return (np.asarray(statusFlags) & (1 << _StatusBit(statusFlag))) > 0
+
+    def Encode(self):
+        """
+        Encode() is the inverse of Decode() - it returns the LNAV payload bytes for this LNAV object.  Scaled fields
+        are rounded to the nearest raw value, and a ValueError is raised if a field is out of range.
+
+        Returns
+        -------
+        bytes : 90 byte LNAV payload
+        """
+        try:
+            values = [self.TimeOfValidity & 0xFFFFFFFF, self.TimeOfValidity >> 32]
+            for name, offset, fmt, multiplier, divisor in _FIELDS:
+                value = getattr(self, name)
+                if multiplier is not None:
+                    value = round(value * divisor / multiplier)
+                values.append(value)
+            return _PAYLOAD_STRUCT.pack(*values)
+        except (struct.error, OverflowError, ValueError):
+            raise ValueError("LNAV {} is out of range".format(_OutOfRangeField(self))) from None
+
+    def EncodeBatch(columns):
+        """
+        EncodeBatch() is the inverse of DecodeBatch() - it encodes columns of LNAV values into LNAV payloads packed
+        back to back.  As with Encode(), a ValueError is raised if any value is out of range.  Requires numpy.
+
+        Parameters
+        ----------
+        columns : dictionary mapping each LNAV property name to an array with one element per LNAV
+
+        Returns
+        -------
+        numpy array : structured array of raw payloads, which may be used as a buffer of 90 byte payloads
+        """
+        if np is None:
+            raise ImportError("LNAV.EncodeBatch requires numpy")
+
+        times = np.asarray(columns["TimeOfValidity"])
+        if times.size and not np.all((times >= 0) & (times < 1 << 48)):
+            raise ValueError("LNAV TimeOfValidity is out of range")
+        times = times.astype(np.uint64)
+        raw = np.zeros(len(times), dtype=_BatchDtype())
+        raw["TimeOfValidityLow"] = times & np.uint64(0xFFFFFFFF)
+        raw["TimeOfValidityHigh"] = times >> np.uint64(32)
+        for name, offset, fmt, multiplier, divisor in _FIELDS:
+            value = np.asarray(columns[name])
+            if multiplier is not None:
+                value = np.rint(value * divisor / multiplier)
+            # Assigning to the raw field would silently wrap (or overflow to infinity) rather than fail as Encode() does
+            rawType = raw.dtype[name]
+            if rawType.kind == "f":
+                limit = np.finfo(rawType).max
+                outOfRange = np.isfinite(value) & (np.abs(value) > limit)
+            else:
+                limits = np.iinfo(rawType)
+                outOfRange = ~((value >= limits.min) & (value <= limits.max))
+            if np.any(outOfRange):
+                raise ValueError("LNAV {} is out of range".format(name))
+            raw[name] = value
+        return raw
+
     def GetStatus(self, statusFlag):
         """
         GetStatus(StatusFlag) takes a statusFlags enum value and returns it state.
@@ -212,7 +471,7 @@ class LNAV:
         -------
         Boolean : state of corresponding status bit
         """
-        return (self.StatusFlags & (1<<(statusFlag.value[0]))) > 0
+        return (self.StatusFlags & (1 << _StatusBit(statusFlag))) > 0
 
     def ToString(self):
         """
@@ -263,4 +522,102 @@ class LNAV:
         else:
             string += "Position Status : OK\n"
         
-        return string
\ No newline at end of file
+        return string
+
+class _LazyField:
+    """
+    Descriptor which decodes one LNAV field from the payload of a LazyLNAV the first time it is read, and caches the
+    result in a slot
+    """
+
+    def __init__(self, slot, offset, fmt, multiplier, divisor):
+        self.__slot = slot
+        self.__unpack = struct.Struct("<" + fmt).unpack_from
+        self.__offset = offset
+        self.__multiplier = multiplier
+        self.__divisor = divisor
+
+    def __get__(self, lnav, owner=None):
+        if lnav is None:
+            return self
+        try:
+            return self.__slot.__get__(lnav)
+        except AttributeError:
+            value = self.__unpack(lnav._payload, self.__offset)[0]
+            if self.__multiplier is not None:
+                value = value * self.__multiplier / self.__divisor
+            self.__slot.__set__(lnav, value)
+            return value
+
+class _LazyTimeOfValidity:
+    """
+    Descriptor which decodes the 48 bit TimeOfValidity of a LazyLNAV the first time it is read
+    """
+
+    def __init__(self, slot):
+        self.__slot = slot
+        self.__unpack = struct.Struct("<IH").unpack_from
+
+    def __get__(self, lnav, owner=None):
+        if lnav is None:
+            return self
+        try:
+            return self.__slot.__get__(lnav)
+        except AttributeError:
+            low, high = self.__unpack(lnav._payload, 0)
+            value = low | (high << 32)
+            self.__slot.__set__(lnav, value)
+            return value
+
+class LazyLNAV:
+    """
+    A compact LNAV which keeps a view of the raw payload, and only decodes each field the first time it is read.
+    It has the same properties as LNAV, and is much cheaper to create when only a few fields are used.
+
+    The payload is not copied, so it must not be modified while the LazyLNAV is in use.
+
+    Methods
+    -------
+    (static) Decode(byte array) returns LazyLNAV object
+    Encode() returns byte array
+    GetStatus(StatusFlags) returns bool
+    ToString() returns string
+    """
+    __slots__ = ("_payload", "_TimeOfValidity") + tuple("_" + field[0] for field in _FIELDS)
+
+    def __init__(self, payload):
+        if len(payload) < LNAV_PAYLOAD_LENGTH:
+            raise ValueError("LNAV payload must be {} bytes".format(LNAV_PAYLOAD_LENGTH))
+        self._payload = payload if isinstance(payload, memoryview) else memoryview(payload)
+
+    def Decode(message):
+        """
+        Decode() Takes a byte array containing LNAV data, and returns a LazyLNAV object which refers to it
+
+        Parameters
+        ----------
+        message : byte array to decode
+
+        Returns
+        -------
+        lnav : LazyLNAV object result
+        """
+        return LazyLNAV(message)
+
+    def Encode(self):
+        """
+        Encode() returns the LNAV payload bytes this LazyLNAV was created from
+
+        Returns
+        -------
+        bytes : 90 byte LNAV payload
+        """
+        return bytes(self._payload[:LNAV_PAYLOAD_LENGTH])
+
+    GetStatus = LNAV.GetStatus
+    ToString = LNAV.ToString
+
+LazyLNAV.TimeOfValidity = _LazyTimeOfValidity(LazyLNAV._TimeOfValidity)
+for _name, _offset, _fmt, _multiplier, _divisor in _FIELDS:
+    setattr(LazyLNAV, _name, _LazyField(getattr(LazyLNAV, "_" + _name), _offset, _fmt, _multiplier, _divisor))
+del _name, _offset, _fmt, _multiplier, _divisor
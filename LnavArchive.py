@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# An append-only columnar file format for decoded LNAVs.
+#
+# The file starts with a header holding the block size and the schema - the name, numpy type, multiplier and divisor
+# of each field - padded to a multiple of 8 bytes.  It is followed by blocks of up to block size LNAVs.  Each block has a small header holding the
+# number of LNAVs and the range of TimeOfValidity it covers, followed by one array per field in schema order.  Fields
+# are stored as the raw integers from the LNAV payload, so nothing is lost and each LNAV takes 92 bytes.
+
+import os
+import struct
+from LNAV import LNAV_PAYLOAD_LENGTH, _BatchDtype, _FIELDS
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is needed to read and write archives
+    np = None
+
+_MAGIC = b"LNAR"
+# Version 1 files didn't pad the file header, so their columns can't be viewed in place
+_VERSION = 2
+_FILE_HEADER = struct.Struct("<4sIII")
+_FIELD_HEADER = struct.Struct("<B7sdd")
+_BLOCK_MAGIC = b"BLCK"
+_BLOCK_HEADER = struct.Struct("<4sIQQ")
+
+def _Schema():
+    """
+    _Schema returns the fields stored in an archive.
+
+    Returns
+    -------
+    list of (name, numpy type string, multiplier, divisor) tuples.  Fields which aren't scaled have a multiplier and
+    divisor of NaN in the file and None here.
+    """
+    dtype = _BatchDtype()
+    schema = [("TimeOfValidity", "<u8", None, None)]
+    for name, offset, fmt, multiplier, divisor in _FIELDS:
+        schema.append((name, dtype.fields[name][0].str, multiplier, divisor))
+    return schema
+
+def _Aligned(size):
+    # The file header, block headers and columns are all padded to multiples of 8 bytes, so that every column starts
+    # on an 8 byte boundary and can be viewed in place
+    return (size + 7) & ~7
+
+class LnavArchiveWriter:
+    """
+    A Class which appends LNAVs to an archive file.  LNAVs are buffered until a whole block has been collected, so
+    each append is cheap.  Appending to an existing archive adds new blocks to the end of it.
+
+    May be used as a context manager, which closes the file on exit.  Requires numpy.
+
+    Methods
+    -------
+    Append(LNAV object)
+
+    AppendPayload(LNAV payload byte array)
+
+    Flush() writes any buffered LNAVs as a (possibly short) block
+
+    Close()
+    """
+
+    def __init__(self, path, blockSize=4096):
+        if np is None:
+            raise ImportError("LnavArchiveWriter requires numpy")
+
+        self.__schema = _Schema()
+        self.__dtype = _BatchDtype()
+        self.__pending = bytearray()
+        self.__pendingCount = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with LnavArchiveReader(path) as reader:
+                if reader.Schema != self.__schema:
+                    raise ValueError("{} has a different schema".format(path))
+                self.__blockSize = reader.BlockSize
+                end = reader._End()
+            self.__file = open(path, "r+b")
+            # Drop any partly written block left by a crash
+            self.__file.truncate(end)
+            self.__file.seek(end)
+        else:
+            self.__blockSize = blockSize
+            self.__file = open(path, "wb")
+            self.__WriteFileHeader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.Close()
+
+    def __WriteFileHeader(self):
+        header = bytearray(_FILE_HEADER.pack(_MAGIC, _VERSION, self.__blockSize, len(self.__schema)))
+        for name, dtype, multiplier, divisor in self.__schema:
+            encodedName = name.encode("ascii")
+            header += _FIELD_HEADER.pack(len(encodedName), dtype.encode("ascii"),
+                                         float("nan") if multiplier is None else multiplier,
+                                         float("nan") if divisor is None else divisor)
+            header += encodedName
+        header += bytes(_Aligned(len(header)) - len(header))
+        self.__file.write(header)
+
+    def Append(self, lnav):
+        """
+        Append() adds an LNAV to the archive.
+
+        Parameters
+        ----------
+        lnav : LNAV object (or LazyLNAV object)
+
+        Returns
+        -------
+        None.
+        """
+        self.AppendPayload(lnav.Encode())
+
+    def AppendPayload(self, payload):
+        """
+        AppendPayload() adds an LNAV to the archive from its raw payload, without decoding it.  This is the cheapest
+        way to log every LNAV received - subscribe it to the LNAV message ID with bytes as the decode function, e.g.
+
+            decoder.Subscribe(224, writer.AppendPayload, bytes)
+
+        Parameters
+        ----------
+        payload : 90 byte LNAV payload
+
+        Returns
+        -------
+        None.
+        """
+        if len(payload) != LNAV_PAYLOAD_LENGTH:
+            raise ValueError("LNAV payload must be {} bytes".format(LNAV_PAYLOAD_LENGTH))
+        self.__pending += payload
+        self.__pendingCount += 1
+        if self.__pendingCount >= self.__blockSize:
+            self.Flush()
+
+    def Flush(self):
+        """
+        Flush() writes any buffered LNAVs to the file as a block.
+
+        Returns
+        -------
+        None.
+        """
+        if self.__pendingCount == 0:
+            return
+
+        raw = np.frombuffer(self.__pending, dtype=self.__dtype)
+        times = raw["TimeOfValidityLow"].astype("<u8") | (raw["TimeOfValidityHigh"].astype("<u8") << np.uint64(32))
+
+        parts = [_BLOCK_HEADER.pack(_BLOCK_MAGIC, len(raw), int(times.min()), int(times.max()))]
+        for name, dtype, multiplier, divisor in self.__schema:
+            column = times if name == "TimeOfValidity" else raw[name]
+            data = np.ascontiguousarray(column, dtype=dtype).tobytes()
+            parts.append(data)
+            parts.append(bytes(_Aligned(len(data)) - len(data)))
+        self.__file.write(b"".join(parts))
+        self.__file.flush()
+
+        self.__pending = bytearray()
+        self.__pendingCount = 0
+
+    def Close(self):
+        """
+        Close() writes any buffered LNAVs and closes the file.
+
+        Returns
+        -------
+        None.
+        """
+        if not self.__file.closed:
+            self.Flush()
+            self.__file.close()
+
+class LnavArchiveReader:
+    """
+    A Class which reads an archive file written by LnavArchiveWriter.  The file is memory mapped, and only the blocks
+    and columns asked for are read.
+
+    May be used as a context manager, which closes the file on exit.  Requires numpy.
+
+    Properties
+    ----------
+    Schema : list of (name, numpy type string, multiplier, divisor) tuples
+    BlockSize : maximum number of LNAVs in each block
+    Blocks : list of (file offset, count, first TimeOfValidity, last TimeOfValidity) tuples for each block
+
+    Methods
+    -------
+    Column(name, start time, end time, raw) returns numpy array
+
+    Columns(names, start time, end time, raw) returns dictionary of numpy arrays
+
+    Close()
+    """
+
+    def __init__(self, path):
+        if np is None:
+            raise ImportError("LnavArchiveReader requires numpy")
+
+        self.Schema = []
+        self.Blocks = []
+        self.__end = 0
+        self.__map = None
+
+        with open(path, "rb") as f:
+            magic, version, self.BlockSize, fieldCount = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+            if magic != _MAGIC or version not in (1, _VERSION):
+                raise ValueError("{} is not an LNAV archive".format(path))
+            for i in range(fieldCount):
+                nameLength, dtype, multiplier, divisor = _FIELD_HEADER.unpack(f.read(_FIELD_HEADER.size))
+                name = f.read(nameLength).decode("ascii")
+                dtype = dtype.rstrip(b"\x00").decode("ascii")
+                if multiplier != multiplier:
+                    multiplier = divisor = None
+                elif multiplier.is_integer() and divisor.is_integer():
+                    multiplier, divisor = int(multiplier), int(divisor)
+                self.Schema.append((name, dtype, multiplier, divisor))
+
+            self.__itemSizes = [np.dtype(dtype).itemsize for name, dtype, multiplier, divisor in self.Schema]
+            self.__end = f.tell() if version == 1 else _Aligned(f.tell())
+            size = os.path.getsize(path)
+
+            # Find the blocks by hopping from one block header to the next
+            while self.__end + _BLOCK_HEADER.size <= size:
+                f.seek(self.__end)
+                magic, count, firstTime, lastTime = _BLOCK_HEADER.unpack(f.read(_BLOCK_HEADER.size))
+                blockEnd = self.__end + _BLOCK_HEADER.size + sum(_Aligned(count * itemSize) for itemSize in self.__itemSizes)
+                if magic != _BLOCK_MAGIC or blockEnd > size:
+                    # A partly written block at the end of the file
+                    break
+                self.Blocks.append((self.__end, count, firstTime, lastTime))
+                self.__end = blockEnd
+
+        if self.Blocks:
+            self.__map = np.memmap(path, dtype=np.uint8, mode="r", shape=(self.__end,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.Close()
+
+    def __len__(self):
+        return sum(block[1] for block in self.Blocks)
+
+    def _End(self):
+        """
+        _End returns the file offset just after the last complete block.
+        """
+        return self.__end
+
+    def Close(self):
+        """
+        Close() releases the memory map.
+
+        Returns
+        -------
+        None.
+        """
+        self.__map = None
+
+    def __ColumnIndex(self, name):
+        for index, field in enumerate(self.Schema):
+            if field[0] == name:
+                return index
+        raise KeyError(name)
+
+    def __BlockColumn(self, block, index):
+        """
+        __BlockColumn returns a view of one column of one block, without copying it unless it is misaligned (as it is
+        in a version 1 file).
+        """
+        offset, count = block[0], block[1]
+        position = offset + _BLOCK_HEADER.size
+        for itemSize in self.__itemSizes[:index]:
+            position += _Aligned(count * itemSize)
+        column = self.__map[position:position + count * self.__itemSizes[index]].view(self.Schema[index][1])
+        if not column.flags.aligned:
+            column = column.copy()
+        return column
+
+    def Columns(self, names, startTime=None, endTime=None, raw=False):
+        """
+        Columns() reads columns from the archive.  Only the blocks whose time range overlaps the requested times are
+        read.
+
+        Parameters
+        ----------
+        names : list of field names to read
+        startTime : earliest TimeOfValidity to return, or None
+        endTime : latest TimeOfValidity to return (inclusive), or None
+        raw : if True return the raw integer values, otherwise scale them as LNAV.Decode() does
+
+        Returns
+        -------
+        dictionary : maps each name to a numpy array, with one element per LNAV in file order
+        """
+        indices = [self.__ColumnIndex(name) for name in names]
+        timeIndex = self.__ColumnIndex("TimeOfValidity")
+        filtered = startTime is not None or endTime is not None
+
+        pieces = {name: [] for name in names}
+        for block in self.Blocks:
+            if (startTime is not None and block[3] < startTime) or (endTime is not None and block[2] > endTime):
+                continue
+
+            selection = slice(None)
+            if filtered:
+                times = self.__BlockColumn(block, timeIndex)
+                mask = np.ones(len(times), dtype=bool)
+                if startTime is not None:
+                    mask &= times >= startTime
+                if endTime is not None:
+                    mask &= times <= endTime
+                selection = mask
+
+            for name, index in zip(names, indices):
+                pieces[name].append(self.__BlockColumn(block, index)[selection])
+
+        columns = {}
+        for name, index in zip(names, indices):
+            fieldName, dtype, multiplier, divisor = self.Schema[index]
+            column = np.concatenate(pieces[name]) if pieces[name] else np.zeros(0, dtype=dtype)
+            if not raw and name != "TimeOfValidity" and name != "StatusFlags":
+                if multiplier is None:
+                    # Widening a signalling NaN sets the invalid flag, but the value is still a NaN as Decode() gives
+                    with np.errstate(invalid="ignore"):
+                        column = column.astype(np.float64)
+                else:
+                    column = column.astype(np.float64) * multiplier / divisor
+            columns[name] = column
+        return columns
+
+    def Column(self, name, startTime=None, endTime=None, raw=False):
+        """
+        Column() reads one column from the archive.  See Columns().
+
+        Returns
+        -------
+        numpy array
+        """
+        return self.Columns([name], startTime, endTime, raw)[name]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import time
+from LNAV import LNAV_PAYLOAD_LENGTH
+from MultiplexedDecoder import _MessageId
+
+class LnavBatchBuffer:
+    """
+    A Class which collects raw LNAV payloads into a preallocated buffer, and passes them to a callback a batch at a
+    time - when the buffer is full, or when the oldest payload in it has waited for the flush interval.  Attached to a
+    decoder, each payload is copied straight from the decoder's message buffer, so no bytes object or LNAV object is
+    created for it; the callback can decode a whole batch at once with LNAV.DecodeBatch().
+
+    Methods
+    -------
+    Attach(MultiplexedDecoder) subscribes the buffer to the decoder's LNAVs
+
+    Add(byte array, offset of the LNAV payload)
+
+    Poll() flushes the buffer if the flush interval has passed
+
+    Flush()
+    """
+
+    def __init__(self, callback, capacity=1024, flushInterval=None):
+        """
+        Parameters
+        ----------
+        callback : function - called with a memoryview of the buffered payloads packed back to back (a multiple of
+        90 bytes).  The buffer is reused once the callback returns, so it must copy anything it keeps.
+        capacity : number of LNAVs in a full batch
+        flushInterval : maximum time in seconds an LNAV is held before its batch is passed on, or None to wait until
+        the buffer is full
+        """
+        self.__callback = callback
+        self.__capacity = capacity
+        self.__flushInterval = flushInterval
+        self.__buffer = memoryview(bytearray(capacity * LNAV_PAYLOAD_LENGTH))
+        self.__count = 0
+        self.__deadline = None
+
+    def __len__(self):
+        return self.__count
+
+    def Attach(self, decoder):
+        """
+        Attach() subscribes the buffer to the LNAVs received by a decoder, without decoding them.
+
+        Parameters
+        ----------
+        decoder : MultiplexedDecoder
+
+        Returns
+        -------
+        None.
+        """
+        # The payload is copied in by the "decode" function, and the callback then counts it
+        decoder.Subscribe(_MessageId.LNAV.value, self.__Added, self.__Copy, inPlace=True)
+
+    def Add(self, payload, offset=0):
+        """
+        Add() copies a payload into the buffer, and flushes the buffer if it is full or the flush interval has passed.
+
+        Parameters
+        ----------
+        payload : byte array holding a 90 byte LNAV payload
+        offset : index of the start of the payload in the byte array
+
+        Returns
+        -------
+        None.
+        """
+        self.__Added(self.__Copy(payload, offset))
+
+    def __Copy(self, payload, offset):
+        start = self.__count * LNAV_PAYLOAD_LENGTH
+        self.__buffer[start:start + LNAV_PAYLOAD_LENGTH] = memoryview(payload)[offset:offset + LNAV_PAYLOAD_LENGTH]
+
+    def __Added(self, unused):
+        self.__count += 1
+        if self.__flushInterval is not None:
+            if self.__deadline is None:
+                self.__deadline = time.monotonic() + self.__flushInterval
+            elif time.monotonic() >= self.__deadline:
+                self.Flush()
+                return
+        if self.__count == self.__capacity:
+            self.Flush()
+
+    def Poll(self):
+        """
+        Poll() flushes the buffer if the flush interval has passed.  Call it periodically when data may stop
+        arriving, so that the last few LNAVs aren't held indefinitely.
+
+        Returns
+        -------
+        None.
+        """
+        if self.__deadline is not None and time.monotonic() >= self.__deadline:
+            self.Flush()
+
+    def Flush(self):
+        """
+        Flush() passes any buffered payloads to the callback.
+
+        Returns
+        -------
+        None.
+        """
+        count = self.__count
+        self.__count = 0
+        self.__deadline = None
+        if count:
+            self.__callback(self.__buffer[:count * LNAV_PAYLOAD_LENGTH])
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import math
+import struct
+from LNAV import _FIELDS, _StatusBit
+
+_OFFSETS = {field[0]: field[1] for field in _FIELDS}
+_SCALES = {field[0]: (field[3], field[4]) for field in _FIELDS}
+
+_TIME_STRUCT = struct.Struct("<IH")
+_STATUS_STRUCT = struct.Struct("<H")
+# Latitude is immediately followed by longitude in the payload, so both are read at once
+_LATITUDE_LONGITUDE_STRUCT = struct.Struct("<ii")
+
+def _StatusMask(statusFlags):
+    mask = 0
+    for statusFlag in statusFlags:
+        mask |= 1 << _StatusBit(statusFlag)
+    return mask
+
+def _RawDegrees(name, degrees, roundUp):
+    multiplier, divisor = _SCALES[name]
+    raw = degrees * divisor / multiplier
+    return math.ceil(raw) if roundUp else math.floor(raw)
+
+class LnavFilter:
+    """
+    A Class which decides whether an LNAV is wanted by looking at its raw payload, without decoding it.  Pass one as
+    the predicate to MultiplexedDecoder.AddLnavCallback() or Subscribe() so that unwanted LNAVs are never decoded.
+
+    The status and bounding box tests are applied first, then the decimation, so that (for example) an interval of one
+    second gives one valid fix per second.  A filter which decimates counts the LNAVs it has seen, so use a separate
+    filter for each subscription and each stream (DecoderPool.Subscribe() takes a predicateFactory for this).
+
+    Properties
+    ----------
+    Decimates : True if the filter has an every or interval, and so keeps state
+
+    Methods
+    -------
+    Reset() restarts the decimation
+    """
+
+    def __init__(self, every=None, interval=None, statusClear=(), statusSet=(), boundingBox=None):
+        """
+        Parameters
+        ----------
+        every : pass only one LNAV in every this many, or None
+        interval : pass an LNAV only if its TimeOfValidity is at least this much later than the last one passed (in
+        the units of TimeOfValidity), or None.  An LNAV earlier than the last one passed restarts the decimation.
+        statusClear : StatusFlags which must be clear, such as [StatusFlags.PositionStatusInvalid]
+        statusSet : StatusFlags which must be set
+        boundingBox : (minimum latitude, minimum longitude, maximum latitude, maximum longitude) in degrees, or None.
+        If the minimum longitude is greater than the maximum, the box crosses the 180 degree meridian.
+        """
+        self.__every = every
+        self.__interval = interval
+        self.Decimates = every is not None or interval is not None
+        self.__statusMask = _StatusMask(statusClear) | _StatusMask(statusSet)
+        self.__statusValue = _StatusMask(statusSet)
+        self.__box = None
+        if boundingBox is not None:
+            minLatitude, minLongitude, maxLatitude, maxLongitude = boundingBox
+            # Compare the raw integers, so the limits are converted to raw values once here
+            self.__box = (_RawDegrees("LatitudeDegrees", minLatitude, True),
+                          _RawDegrees("LongitudeDegrees", minLongitude, True),
+                          _RawDegrees("LatitudeDegrees", maxLatitude, False),
+                          _RawDegrees("LongitudeDegrees", maxLongitude, False))
+        self.Reset()
+
+    def Reset(self):
+        """
+        Reset() restarts the decimation, so the next LNAV which passes the other tests is passed.
+
+        Returns
+        -------
+        None.
+        """
+        self.__skip = 0
+        self.__lastTime = None
+
+    def __call__(self, buffer, offset=0):
+        """
+        Parameters
+        ----------
+        buffer : bytes like object holding a raw LNAV payload
+        offset : index of the start of the payload in buffer
+
+        Returns
+        -------
+        bool : True if the LNAV is wanted
+        """
+        if self.__statusMask:
+            statusFlags = _STATUS_STRUCT.unpack_from(buffer, offset + _OFFSETS["StatusFlags"])[0]
+            if statusFlags & self.__statusMask != self.__statusValue:
+                return False
+
+        if self.__box is not None:
+            latitude, longitude = _LATITUDE_LONGITUDE_STRUCT.unpack_from(buffer, offset + _OFFSETS["LatitudeDegrees"])
+            minLatitude, minLongitude, maxLatitude, maxLongitude = self.__box
+            if not minLatitude <= latitude <= maxLatitude:
+                return False
+            if minLongitude <= maxLongitude:
+                if not minLongitude <= longitude <= maxLongitude:
+                    return False
+            elif maxLongitude < longitude < minLongitude:
+                return False
+
+        if self.__interval is not None:
+            low, high = _TIME_STRUCT.unpack_from(buffer, offset)
+            timeOfValidity = low | (high << 32)
+            if self.__lastTime is not None and self.__lastTime <= timeOfValidity < self.__lastTime + self.__interval:
+                return False
+            self.__lastTime = timeOfValidity
+
+        if self.__every is not None:
+            if self.__skip:
+                self.__skip -= 1
+                return False
+            self.__skip = self.__every - 1
+
+        return True
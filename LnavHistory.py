@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import threading
+from array import array
+from LNAV import LNAV, _FIELDS
+
+# Fields which are interpolated between fixes, and the range angles are wrapped into (None if not an angle).  All
+# other fields are taken from the fix before the requested time.
+_INTERPOLATED = {
+    "LatitudeDegrees": None,
+    "LongitudeDegrees": -180.0,
+    "DepthMetres": None,
+    "AltitudeMetres": None,
+    "RollDegrees": -180.0,
+    "PitchDegrees": None,
+    "HeadingDegrees": 0.0,
+    "VelocityNorthMetresPerSecond": None,
+    "VelocityEastMetresPerSecond": None,
+    "VelocityDownMetresPerSecond": None,
+}
+
+def _Interpolate(a, b, fraction, wrapFrom):
+    """
+    _Interpolate interpolates linearly from a to b.  Angles are interpolated the short way round, so that a heading of
+    350 to 10 degrees passes through 0 rather than 180, and the result is wrapped into wrapFrom to wrapFrom + 360.
+    """
+    if wrapFrom is None:
+        return a + (b - a) * fraction
+    difference = (b - a + 180.0) % 360.0 - 180.0
+    return (a + difference * fraction - wrapFrom) % 360.0 + wrapFrom
+
+class LnavHistory:
+    """
+    A Class which keeps the most recent fixes from one source in preallocated arrays, one per LNAV property, used as
+    a ring buffer.  Fixes must arrive in TimeOfValidity order; a fix which isn't later than the latest one is ignored
+    and counted in OutOfOrder.  Fixes may be added on one thread while others read them.
+
+    Methods
+    -------
+    Add(LNAV object) - may be passed to MultiplexedDecoder.AddLnavCallback()
+
+    Latest() returns LNAV object
+
+    At(time of validity) returns LNAV object
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        Parameters
+        ----------
+        capacity : number of fixes kept - once full, each new fix replaces the oldest
+        """
+        self.__capacity = capacity
+        self.__times = array("Q", [0]) * capacity
+        self.__columns = {name: array("H" if name == "StatusFlags" else "d", [0]) * capacity
+                          for name, offset, fmt, multiplier, divisor in _FIELDS}
+        self.__start = 0
+        self.__count = 0
+        # Once the history is full a new fix overwrites the oldest, so readers must not see a fix half written
+        self.__lock = threading.Lock()
+        self.OutOfOrder = 0
+
+    def __len__(self):
+        return self.__count
+
+    def Add(self, lnav):
+        """
+        Add() stores a fix, replacing the oldest one if the history is full.
+
+        Parameters
+        ----------
+        lnav : LNAV object (or LazyLNAV object)
+
+        Returns
+        -------
+        None.
+        """
+        # Read the values before taking the lock, as a LazyLNAV decodes them on first access
+        timeOfValidity = lnav.TimeOfValidity
+        values = [getattr(lnav, name) for name in self.__columns]
+
+        with self.__lock:
+            if self.__count and timeOfValidity <= self.__times[(self.__start + self.__count - 1) % self.__capacity]:
+                self.OutOfOrder += 1
+                return
+
+            if self.__count < self.__capacity:
+                index = (self.__start + self.__count) % self.__capacity
+                self.__count += 1
+            else:
+                index = self.__start
+                self.__start = (self.__start + 1) % self.__capacity
+
+            self.__times[index] = timeOfValidity
+            for column, value in zip(self.__columns.values(), values):
+                column[index] = value
+
+    def __Fix(self, index):
+        """
+        __Fix builds an LNAV object from the fix stored at a ring buffer index.
+        """
+        lnav = LNAV()
+        lnav.TimeOfValidity = self.__times[index]
+        for name, column in self.__columns.items():
+            setattr(lnav, name, column[index])
+        return lnav
+
+    def Latest(self):
+        """
+        Latest() returns the most recent fix.
+
+        Returns
+        -------
+        LNAV object, or None if the history is empty
+        """
+        with self.__lock:
+            if self.__count == 0:
+                return None
+            return self.__Fix((self.__start + self.__count - 1) % self.__capacity)
+
+    def At(self, timeOfValidity):
+        """
+        At() returns the state at a given time.  Between two fixes, position, attitude and velocity are interpolated
+        (with angles taking the short way round) and the other properties are taken from the earlier fix.
+
+        Parameters
+        ----------
+        timeOfValidity : the time wanted, in the same units as LNAV.TimeOfValidity
+
+        Returns
+        -------
+        LNAV object with the requested TimeOfValidity, or None if the time is before the oldest fix or after the
+        latest one
+        """
+        with self.__lock:
+            if self.__count == 0:
+                return None
+
+            # Binary search for the first fix at or after the time wanted
+            times, start, capacity = self.__times, self.__start, self.__capacity
+            low, high = 0, self.__count
+            while low < high:
+                middle = (low + high) // 2
+                if times[(start + middle) % capacity] < timeOfValidity:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == self.__count:
+                return None
+
+            after = (start + low) % capacity
+            if times[after] == timeOfValidity:
+                return self.__Fix(after)
+            if low == 0:
+                return None
+
+            before = (start + low - 1) % capacity
+            lnav = self.__Fix(before)
+            fraction = (timeOfValidity - times[before]) / (times[after] - times[before])
+            for name, wrapFrom in _INTERPOLATED.items():
+                column = self.__columns[name]
+                setattr(lnav, name, _Interpolate(column[before], column[after], fraction, wrapFrom))
+            lnav.TimeOfValidity = timeOfValidity
+            return lnav
+
+class LnavHistoryStore:
+    """
+    A Class which keeps an LnavHistory for each source.
+
+    Methods
+    -------
+    Add(source, LNAV object) - may be passed to DecodePipeline.AddLnavCallback()
+
+    History(source) returns LnavHistory
+
+    Latest(source) returns LNAV object
+
+    At(source, time of validity) returns LNAV object
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        Parameters
+        ----------
+        capacity : number of fixes kept for each source
+        """
+        self.__capacity = capacity
+        self.__histories = {}
+
+    def __len__(self):
+        return len(self.__histories)
+
+    def Add(self, source, lnav):
+        """
+        Add() stores a fix from a source.
+
+        Parameters
+        ----------
+        source : any hashable value identifying the source
+        lnav : LNAV object (or LazyLNAV object)
+
+        Returns
+        -------
+        None.
+        """
+        history = self.__histories.get(source)
+        if history is None:
+            history = self.__histories.setdefault(source, LnavHistory(self.__capacity))
+        history.Add(lnav)
+
+    def History(self, source):
+        """
+        History() returns the LnavHistory of a source, or None if nothing has been received from it.
+        """
+        return self.__histories.get(source)
+
+    def Latest(self, source):
+        """
+        Latest() returns the most recent fix from a source, or None.  See LnavHistory.Latest().
+        """
+        history = self.__histories.get(source)
+        return history.Latest() if history is not None else None
+
+    def At(self, source, timeOfValidity):
+        """
+        At() returns the state of a source at a given time, or None.  See LnavHistory.At().
+        """
+        history = self.__histories.get(source)
+        return history.At(timeOfValidity) if history is not None else None
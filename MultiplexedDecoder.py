@@ -14,8 +14,11 @@
 # COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import time
+from collections import namedtuple
 from enum import Enum
-from LNAV import LNAV
+from DecoderStats import DecoderStats
+from LNAV import LNAV, LNAV_PAYLOAD_LENGTH, LazyLNAV
 
 # This could be expanded to decode other types of message
 class _MessageId(Enum):
@@ -24,6 +27,98 @@ class _MessageId(Enum):
     """
     LNAV = 224
 
+# How to decode a message ID.  PayloadLength is the number of bytes between the header and the checksum, or None if
+# it may vary, and Decode is a function which takes the payload bytes and returns the decoded message.
+MessageType = namedtuple("MessageType", ["PayloadLength", "Decode"])
+
+# Message types known to every decoder, keyed by message ID.  Messages with IDs not in this table can still be
+# subscribed to, in which case the subscribers are passed the raw payload bytes.
+_MESSAGE_TYPES = {
+    _MessageId.LNAV.value: MessageType(LNAV_PAYLOAD_LENGTH, LNAV.Decode),
+}
+
+def RegisterMessageType(messageId, payloadLength, decode):
+    """
+    RegisterMessageType() teaches all decoders how to decode another message ID.  Each decoder takes a copy of the
+    definition when the first subscription to the message ID is made, and uses it for the length check and for every
+    later subscription to that ID.  A decoder which already has subscribers for the message ID when it is registered
+    again therefore carries on using the previous definition - both the payload length and the decode function - until
+    all of them have unsubscribed.
+
+    Parameters
+    ----------
+    messageId : the message ID
+    payloadLength : number of bytes between the header and the checksum, or None if it may vary
+    decode : function which takes the payload bytes and returns the decoded message
+
+    Returns
+    -------
+    None.
+    """
+    _MESSAGE_TYPES[messageId] = MessageType(payloadLength, decode)
+
+def _RawPayload(payload):
+    return payload
+
+# Used for message IDs which haven't been registered
+_RAW_MESSAGE_TYPE = MessageType(None, _RawPayload)
+
+_DLE = 0x10
+_STX = 0x02
+_ETX = 0x03
+_DLE_BYTES = b"\x10"
+_DLE_STX_BYTES = b"\x10\x02"
+
+# DecodeBytes steps through chunks of up to this many bytes one at a time, rather than scanning them for DLEs
+_SMALL_CHUNK = 12
+
+# A buffered message longer than this can't be valid, so the decoder discards it and waits for the next DLE+STX
+_MAX_MESSAGE_LENGTH = 4096
+
+# In recovery mode, the most candidate messages checksummed when looking for a message inside one which failed
+_MAX_RECOVERY_ATTEMPTS = 4
+
+# A complete multiplexed message as passed to a frame callback.  Offset is the position of its DLE+STX in the stream
+# of bytes passed to the decoder, and Length is the number of stream bytes from the DLE+STX to the DLE+ETX
+# inclusive.  Message holds the un-byte-stuffed header, payload and checksum.
+Frame = namedtuple("Frame", ["Offset", "Length", "MessageId", "ChecksumOk", "Message"])
+
+class _FramingState:
+    """
+    The framing state of one stream, saved by MultiplexedDecoder._SaveState() so that one decoder can be shared
+    between many streams.  Partial holds the bytes of a partly received message, or None.
+    """
+    __slots__ = ("InMessage", "DleReceived", "StreamOffset", "MessageOffset", "Partial")
+
+    def __init__(self):
+        self.InMessage = False
+        self.DleReceived = False
+        self.StreamOffset = 0
+        self.MessageOffset = 0
+        self.Partial = None
+
+def _XorChecksum(message):
+    """
+    _XorChecksum XORs all of the bytes of a message together.  Rather than looping over every byte, the message is
+    read as one large integer which is repeatedly folded in half until only a single byte remains.
+
+    Parameters
+    ----------
+    message : byte array to checksum
+
+    Returns
+    -------
+    integer : the XOR of all the bytes in message
+    """
+    value = int.from_bytes(message, "little")
+    width = 8
+    while width < len(message) * 8:
+        width <<= 1
+    while width > 8:
+        width >>= 1
+        value = (value >> width) ^ (value & ((1 << width) - 1))
+    return value
+
 class MultiplexedDecoder:    
     """
     A Class which decodes Sonardyne Multiplexed Packets
@@ -33,15 +128,34 @@ class MultiplexedDecoder:
     DecodeBytes(byte array of bytes to be decoded)
     
     AddLnavCallback(function to provide callback when an LNAV is received)
+
+    Subscribe(message id, function to provide callback when a message with that ID is received)
+
+    Unsubscribe(message id, function)
+
+    AddFrameCallback(function to provide callback when any complete message is received)
+
+    EnableStats(True to record latency histograms), DisableStats(), GetStats() returns dictionary, ResetStats()
+
+    EnableRecovery(), DisableRecovery()
     """
     
     def __init__(self):
         self.__inMessage = False
         self.__dleReceived = False
-        self.__currentMessage = b''
+        self.__currentMessage = bytearray()
+        self.__streamOffset = 0
+        self.__messageOffset = 0
+        # Maps message ID to a tuple of (payload length, list of (decode function, callback, predicate, in place))
+        self.__subscriptions = {}
+        # The MessageType of each subscribed message ID, as it was when the first subscription to it was made
+        self.__messageTypes = {}
         self.__LnavCallback = None
+        self.__FrameCallback = None
+        self.__stats = None
+        self.__recover = False
 
-    def __DecodeMessage(self, message):
+    def __DecodeMessage(self, message, offset, length):
         """
         __DecodeMessage takes a message (where the DLE+STX / DLE+ETX and any DLE+DLE have already been removed) checks it's checksum, 
         and then calls the appropriate decoder based on the message ID.  If the checksum fails or the message is the 
@@ -50,31 +164,203 @@ class MultiplexedDecoder:
         Parameters
         ----------
         message : byte array - contains the message to be decoded with the DLE STX and DLE ETX removed
+        offset : stream offset of the DLE STX which started the message
+        length : number of stream bytes from the DLE STX to the DLE ETX inclusive
             
         Returns
         -------
         None.
         """
         
-        # XOR all the bytes, if the result is zero then the checksum is OK
-        checksum = 0
-        for byte in message:
-            checksum ^= byte
-        if checksum != 0:
-            # Checksum error
+        stats = self.__stats
+        if stats is not None:
+            stats.Frames += 1
+
+        # Too short to hold the 2 byte header and the checksum
+        if len(message) < 3:
+            if stats is not None:
+                stats.LengthErrors += 1
             return
 
         # 'hasTime' not used here - but included for reference
         hasTime = message[0] & 0x80 == 0x80
         messageId = ((message[0] & 0x03) << 8) + message[1]
-        
+
+        if self.__FrameCallback is not None:
+            message = bytes(message)
+            self.__FrameCallback(Frame(offset, length, messageId, _XorChecksum(message) == 0, message))
+
+        # Nobody wants this message, so don't spend any more time on it
+        subscription = self.__subscriptions.get(messageId)
+        if subscription is None:
+            if stats is not None:
+                stats.FramesSkipped += 1
+                stats.BytesAccepted += length
+            return
+
         # subtract 3 off for the 2 bytes header and the 1 byte checksum to get the message length
-        # This could be extended to decode other message ids
-        if (messageId == _MessageId.LNAV.value and (len(message) -3) == 90):
-            lnav = LNAV.Decode(message[2:92]) 
-            if self.__LnavCallback is not None:
-                self.__LnavCallback(lnav)
+        payloadLength, subscribers = subscription
+        if payloadLength is not None and len(message) - 3 != payloadLength:
+            if stats is not None:
+                stats.LengthErrors += 1
+            if self.__recover:
+                self.__Recover(message)
+            return
+
+        if stats is not None and stats.DecodeLatency is not None:
+            self.__DispatchTimed(message, length, subscribers, stats)
+            return
+
+        # XOR all the bytes, if the result is zero then the checksum is OK
+        if _XorChecksum(message) != 0:
+            # Checksum error
+            if stats is not None:
+                stats.ChecksumErrors += 1
+            if self.__recover:
+                self.__Recover(message)
+            return
+
+        if stats is not None:
+            stats.FramesDecoded += 1
+            stats.BytesAccepted += length
+            if not self.__Deliver(message, subscribers):
+                stats.FramesFiltered += 1
+            return
+
+        self.__Deliver(message, subscribers)
+
+    def __Deliver(self, message, subscribers):
+        """
+        __Deliver decodes the payload of a message which has passed its checks, and calls the subscribers whose
+        predicates accept it.
+
+        Parameters
+        ----------
+        message : byte array - the message with the DLE STX and DLE ETX removed
+        subscribers : list of (decode function, callback, predicate, True if decode takes (buffer, offset))
+
+        Returns
+        -------
+        bool : True if any subscriber was called
+        """
+        payload = None
+        lastDecode = None
+        delivered = False
+        for decode, func, predicate, inPlace in subscribers:
+            # Predicates look at the raw message, so a message nobody accepts is never copied or decoded
+            if predicate is not None and not predicate(message, 2):
+                continue
+            delivered = True
+            if inPlace:
+                func(decode(message, 2))
+                continue
+            # Subscribers sharing a decode function share the decoded message
+            if decode is not lastDecode:
+                if payload is None:
+                    payload = bytes(message[2:-1])
+                decoded = decode(payload)
+                lastDecode = decode
+            func(decoded)
+        return delivered
+
+    def __Recover(self, message):
+        """
+        __Recover looks for a complete message inside one which failed its checks.  If the DLE+ETX of a message is
+        lost, or a stray DLE arrives just before a DLE+STX, the DLE+STX of the next message is taken as an escaped DLE
+        followed by STX.  The next message is then added to the end of the failed one, where it appears after a DLE
+        and STX.  Each candidate is checked against its registered length before it is checksummed, and at most
+        _MAX_RECOVERY_ATTEMPTS are checksummed, so the work done is bounded.
+
+        Parameters
+        ----------
+        message : byte array - the failed message with the DLE STX and DLE ETX removed
+
+        Returns
+        -------
+        None.
+        """
+        pos = 0
+        attempts = 0
+        while attempts < _MAX_RECOVERY_ATTEMPTS:
+            candidate = message.find(_DLE_STX_BYTES, pos) + 2
+            if candidate < 2 or len(message) - candidate < 3:
+                return
+            pos = candidate - 1
+
+            messageId = ((message[candidate] & 0x03) << 8) + message[candidate + 1]
+            subscription = self.__subscriptions.get(messageId)
+            if subscription is None:
+                continue
+            payloadLength, subscribers = subscription
+            if payloadLength is not None and len(message) - candidate - 3 != payloadLength:
+                continue
+
+            attempts += 1
+            recovered = message[candidate:]
+            if _XorChecksum(recovered) == 0:
+                delivered = self.__Deliver(recovered, subscribers)
+                if self.__stats is not None:
+                    self.__stats.FramesDecoded += 1
+                    self.__stats.FramesRecovered += 1
+                    if not delivered:
+                        self.__stats.FramesFiltered += 1
+                return
     
+    def __DispatchTimed(self, message, length, subscribers, stats):
+        """
+        __DispatchTimed is the end of __DecodeMessage when latency histograms are enabled - it checks the checksum,
+        decodes the message and calls the subscribers, timing the decoding and the callbacks separately.
+
+        Parameters
+        ----------
+        message : byte array - the message with the DLE STX and DLE ETX removed
+        length : number of stream bytes from the DLE STX to the DLE ETX inclusive
+        subscribers : list of (decode function, callback, predicate, True if decode takes (buffer, offset))
+        stats : DecoderStats to update
+
+        Returns
+        -------
+        None.
+        """
+        decodeTime = 0
+        callbackTime = 0
+
+        start = time.perf_counter_ns()
+        if _XorChecksum(message) != 0:
+            stats.ChecksumErrors += 1
+            if self.__recover:
+                self.__Recover(message)
+            return
+        stats.FramesDecoded += 1
+        stats.BytesAccepted += length
+
+        payload = None
+        lastDecode = None
+        delivered = False
+        for decode, func, predicate, inPlace in subscribers:
+            if predicate is not None and not predicate(message, 2):
+                continue
+            delivered = True
+            if inPlace:
+                decoded = decode(message, 2)
+                lastDecode = None
+            elif decode is not lastDecode:
+                if payload is None:
+                    payload = bytes(message[2:-1])
+                decoded = decode(payload)
+                lastDecode = decode
+            decodedAt = time.perf_counter_ns()
+            decodeTime += decodedAt - start
+            func(decoded)
+            start = time.perf_counter_ns()
+            callbackTime += start - decodedAt
+        if not delivered:
+            stats.FramesFiltered += 1
+            decodeTime += time.perf_counter_ns() - start
+
+        stats.DecodeLatency.Record(decodeTime)
+        stats.CallbackLatency.Record(callbackTime)
+
     # Un-byte-stuffs the multiplexed packets.  Packets start with DLE STX, and finish with DLE ETX.  
     # Any DLE characters within the message are escaped with another DLE
     def DecodeBytes(self, multiplexedBytes):
@@ -82,6 +368,11 @@ class MultiplexedDecoder:
         DecodeBytes takes an array of bytes and unbyte-stuffs and demultiplexes the message it contains.
         it keeps a buffer of bytes received, so may be called repeatedly with bytes as they are received
 
+        Rather than stepping through the input one byte at a time, each chunk is scanned for the next DLE and the run
+        of bytes before it is copied into the message buffer in one go.  Only the byte following each DLE needs to be
+        looked at individually.  Chunks of only a few bytes, as serial ports often deliver, are still stepped through
+        a byte at a time, as setting up the scan would cost more than it saves.
+
         Parameters
         ----------
         multiplexedBytes : byte array - bytes to be decoded.
@@ -90,79 +381,390 @@ class MultiplexedDecoder:
         -------
         None.
         """
-        
-        DLE = b"\x10"
-        STX = b"\x02"
-        ETX = b"\x03"
-            
+        length = len(multiplexedBytes)
+        if length > _SMALL_CHUNK:
+            if not isinstance(multiplexedBytes, (bytes, bytearray)):
+                multiplexedBytes = bytes(multiplexedBytes)
+            self._Frame(multiplexedBytes, 0, length)
+            return
+
+        # The same state machine as _Frame, one byte at a time
+        message = self.__currentMessage
+        inMessage = self.__inMessage
+        dleReceived = self.__dleReceived
+        offset = self.__streamOffset
+        self.__streamOffset = offset + length
+        stats = self.__stats
+        if stats is not None:
+            stats.BytesIn += length
+
         for dbyte in multiplexedBytes:
-            dbyte = dbyte.to_bytes(1,byteorder='big')
-            if dbyte != '':
-                # stop the buffer getting indefinately large - if it's more than 4K, then it's not a valid message
-                if len(self.__currentMessage) > 4096:
-                    self.__dleReceived = False
-                    self.__inMessage = False
-                    self.__currentMessage = b""                       
-                
-                if dbyte == DLE: 
-                    if self.__dleReceived:
-                        # DLE escaping by other DLE - so add a DLE to the message
-                        self.__dleReceived = False
-                        if (self.__inMessage):
-                            self.__currentMessage += dbyte
-                    else:
-                        # otherwise record that a DLE has been received
-                        self.__dleReceived = True
-
-                elif dbyte == STX:
-                    if self.__dleReceived:
-                        # if a STX is received after a DLE then clear down and start a new message
-                        self.__dleReceived = False
-                        self.__inMessage = True
-                        self.__currentMessage = b""   
-                    else:
-                        # otherwise if it's just an STX on it's own just add the STX to the message
-                        if (self.__inMessage):
-                            self.__currentMessage += dbyte
-                        
-                elif dbyte == ETX:
-                    if self.__dleReceived:
-                        # if a ETX is received after a DLE and we are in a message, then we have a complete message to pass to DecodeMessage()
-                        self.__dleReceived = False
-                        if (self.__inMessage):
-                            self.__inMessage = False
-                            self.__DecodeMessage(self.__currentMessage)
-                    else:
-                        # otherwise if it's just an ETX on it's own just add the ETX to the message                        
-                        if (self.__inMessage):
-                            self.__currentMessage += dbyte           
+            if dleReceived:
+                # In recovery mode, outside a message DLE DLE can't be an escape, so the second DLE may start a DLE+STX
+                if not (dbyte == _DLE and self.__recover and not inMessage):
+                    dleReceived = False
+                    inMessage = self.__Control(dbyte, inMessage, offset - 1)
+            elif dbyte == _DLE:
+                dleReceived = True
+            elif inMessage:
+                if len(message) < _MAX_MESSAGE_LENGTH:
+                    message.append(dbyte)
                 else:
-                    if self.__dleReceived:
-                        # This shouldn't happen - DLE Should always be followed by STX, ETX or DLE
-                        # error unescaped DLE
-                        # So start listing for a new DLE
-                        self.__dleReceived = False
-                        self.__inMessage = False
-                        self.__currentMessage = b""                       
-                    else:               
-                        # otherwise add the byte to the message                        
-                        if (self.__inMessage):
-                            self.__currentMessage += dbyte
-
-                                            
-
-    def AddLnavCallback(self, func):
+                    inMessage = False
+                    message.clear()
+                    if stats is not None:
+                        stats.Overflows += 1
+            offset += 1
+
+        self.__inMessage = inMessage
+        self.__dleReceived = dleReceived
+
+    def _Frame(self, data, start, end):
+        """
+        _Frame runs the DLE framing state machine over data[start:end].  data may be any object which supports the
+        buffer protocol and has a find(sub, start, end) method (bytes, bytearray or mmap), so callers holding a large
+        buffer can frame part of it without copying it first.
+
+        Parameters
+        ----------
+        data : bytes like object to be decoded
+        start : index of the first byte to decode
+        end : index one past the last byte to decode
+
+        Returns
+        -------
+        None.
+        """
+        message = self.__currentMessage
+        inMessage = self.__inMessage
+        recover = self.__recover
+        pos = start
+
+        # base converts a position in data into an offset in the stream of all bytes passed to the decoder
+        base = self.__streamOffset - start
+        self.__streamOffset += end - start
+        if self.__stats is not None:
+            self.__stats.BytesIn += end - start
+
+        with memoryview(data) as view:
+            if self.__dleReceived and pos < end:
+                # The previous chunk finished with a DLE, so the first byte of this chunk is the one following it
+                self.__dleReceived = False
+                if not (recover and not inMessage and data[pos] == _DLE):
+                    inMessage = self.__Control(data[pos], inMessage, base + pos - 1)
+                    pos += 1
+
+            while pos < end:
+                dlePos = data.find(_DLE_BYTES, pos, end)
+                if inMessage:
+                    runEnd = end if dlePos < 0 else dlePos
+                    if runEnd > pos:
+                        # stop the buffer getting indefinately large - if it's more than 4K, then it's not a valid
+                        # message.  The rest of the run contains no DLE so can't start a new message either.
+                        if len(message) + runEnd - pos > _MAX_MESSAGE_LENGTH:
+                            inMessage = False
+                            message.clear()
+                            if self.__stats is not None:
+                                self.__stats.Overflows += 1
+                        else:
+                            message += view[pos:runEnd]
+                if dlePos < 0:
+                    break
+                if dlePos + 1 == end:
+                    # DLE is the last byte - remember it until the next chunk arrives
+                    self.__dleReceived = True
+                    break
+                if recover and not inMessage and data[dlePos + 1] == _DLE:
+                    # Outside a message DLE DLE can't be an escape, so the second DLE may be the start of a DLE+STX
+                    pos = dlePos + 1
+                    continue
+                pos = dlePos + 2
+                inMessage = self.__Control(data[dlePos + 1], inMessage, base + dlePos)
+
+        self.__inMessage = inMessage
+
+    def __Control(self, dbyte, inMessage, dleOffset):
+        """
+        __Control handles the byte following a DLE.
+
+        Parameters
+        ----------
+        dbyte : integer value of the byte following the DLE
+        inMessage : True if a message is currently being received
+        dleOffset : stream offset of the DLE
+
+        Returns
+        -------
+        inMessage : True if a message is being received after this byte has been handled
+        """
+        message = self.__currentMessage
+        if dbyte == _DLE:
+            # DLE escaping by other DLE - so add a DLE to the message
+            if inMessage:
+                message.append(_DLE)
+                if len(message) > _MAX_MESSAGE_LENGTH:
+                    message.clear()
+                    if self.__stats is not None:
+                        self.__stats.Overflows += 1
+                    return False
+            return inMessage
+
+        if dbyte == _STX:
+            # if a STX is received after a DLE then clear down and start a new message
+            message.clear()
+            self.__messageOffset = dleOffset
+            return True
+
+        if dbyte == _ETX:
+            # if a ETX is received after a DLE and we are in a message, then we have a complete message to pass to
+            # DecodeMessage()
+            if inMessage:
+                self.__inMessage = False
+                self.__DecodeMessage(message, self.__messageOffset, dleOffset + 2 - self.__messageOffset)
+                message.clear()
+            return False
+
+        # This shouldn't happen - DLE Should always be followed by STX, ETX or DLE
+        # error unescaped DLE
+        # So start listing for a new DLE
+        if inMessage and self.__stats is not None:
+            self.__stats.Resyncs += 1
+        message.clear()
+        return False
+
+    def AddLnavCallback(self, func, lazy=False, into=None, predicate=None):
         """
         AddLnavCallback
 
         Parameters
         ----------
         func : function - A callback to be called when an LNAV message is decoded.  The callback takes one parmeter, which is
-        an LNAV object
+        an LNAV object.  This replaces any callback previously added with AddLnavCallback; use Subscribe() to add
+        more than one.
+        lazy : if True the callback is passed a LazyLNAV, which only decodes the fields that are read
+        into : a record to decode every LNAV into with LNAV.DecodeInto(), which is passed to the callback instead of a
+        new LNAV object.  The record is overwritten by the next LNAV, so the callback must copy anything it keeps.
+        predicate : function which decides from the raw message whether to decode it and call the callback, such as an
+        LnavFilter, or None.  See Subscribe().
 
         Returns
         -------
         None.
 
         """
+        if lazy and into is not None:
+            raise ValueError("lazy and into can't be used together")
+        if self.__LnavCallback is not None:
+            self.Unsubscribe(_MessageId.LNAV.value, self.__LnavCallback)
         self.__LnavCallback = func
+        if func is not None:
+            if into is not None:
+                # Decode straight from the message buffer, so the payload isn't copied either
+                self.Subscribe(_MessageId.LNAV.value, func, lambda buffer, offset: LNAV.DecodeInto(buffer, into, offset),
+                               predicate, inPlace=True)
+            else:
+                self.Subscribe(_MessageId.LNAV.value, func, LazyLNAV if lazy else None, predicate)
+
+    def Subscribe(self, messageId, func, decode=None, predicate=None, inPlace=False):
+        """
+        Subscribe
+
+        Parameters
+        ----------
+        messageId : ID of the messages wanted
+        func : function - A callback to be called when a message with this ID passes its checksum.  The callback takes
+        one parameter, which is the decoded message, or the payload bytes if the message ID has not been registered
+        with RegisterMessageType()
+        decode : function to decode the payload bytes with instead of the registered one, or None
+        predicate : function taking (buffer, offset), where the payload starts at buffer[offset], which returns True
+        if the callback wants the message.  It is called after the checksum is checked but before the payload is
+        copied or decoded, so messages it rejects cost very little.  None passes every message.
+        inPlace : if True, decode is called with (buffer, offset) as a predicate is, rather than with a copy of the
+        payload, so the payload is read where it is.  The buffer is reused for the next message, so decode must not
+        keep it.
+
+        Returns
+        -------
+        None.
+
+        """
+        if decode is None and inPlace:
+            raise ValueError("inPlace needs a decode function which takes (buffer, offset)")
+        messageType = self.__messageTypes.get(messageId)
+        if messageType is None:
+            messageType = self.__messageTypes[messageId] = _MESSAGE_TYPES.get(messageId, _RAW_MESSAGE_TYPE)
+        if decode is None:
+            decode = messageType.Decode
+        subscription = self.__subscriptions.get(messageId)
+        subscribers = [] if subscription is None else list(subscription[1])
+
+        # Keep subscribers which share a decode function together so that the message is only decoded once
+        index = len(subscribers)
+        for i, subscriber in enumerate(subscribers):
+            if subscriber[0] is decode:
+                index = i + 1
+        subscribers.insert(index, (decode, func, predicate, inPlace))
+        # Swap in a new list rather than changing the one in use, so that a message being delivered on another thread
+        # goes to either the old subscribers or the new ones
+        self.__subscriptions[messageId] = (messageType.PayloadLength, subscribers)
+
+    def Unsubscribe(self, messageId, func):
+        """
+        Unsubscribe
+
+        Parameters
+        ----------
+        messageId : ID the callback was subscribed to
+        func : function - the callback to remove
+
+        Returns
+        -------
+        None.
+
+        """
+        subscription = self.__subscriptions.get(messageId)
+        if subscription is None:
+            return
+        subscribers = [subscriber for subscriber in subscription[1] if subscriber[1] != func]
+        if subscribers:
+            self.__subscriptions[messageId] = (subscription[0], subscribers)
+        else:
+            # With no subscribers left, messages with this ID are skipped without being checksummed
+            del self.__subscriptions[messageId]
+            del self.__messageTypes[messageId]
+
+    def AddFrameCallback(self, func):
+        """
+        AddFrameCallback
+
+        Parameters
+        ----------
+        func : function - A callback to be called for every complete message received, whatever its message ID and
+        including those which fail their checksum.  The callback takes one parameter, which is a Frame
+
+        Returns
+        -------
+        None.
+
+        """
+        self.__FrameCallback = func
+
+    def EnableStats(self, latency=False):
+        """
+        EnableStats starts counting bytes, messages and dropped data, so that the health of the link can be monitored.
+        The counters cost very little to keep, but nothing at all is counted until this is called.
+
+        Parameters
+        ----------
+        latency : if True, also record histograms of the time taken to decode each message and to run its callbacks
+
+        Returns
+        -------
+        None.
+
+        """
+        self.__stats = DecoderStats(latency)
+
+    def EnableRecovery(self):
+        """
+        EnableRecovery makes the decoder work harder to find messages in a corrupted stream.  When a message fails its
+        checksum or length check, the bytes already buffered are searched for a complete message that was swallowed
+        by it.  While looking for the start of a message, a DLE DLE is no longer taken as an escaped DLE, so a stray
+        DLE can't hide the DLE+STX after it.  Messages found this way are counted in FramesRecovered.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.__recover = True
+
+    def DisableRecovery(self):
+        """
+        DisableRecovery goes back to dropping messages which fail their checks, without looking inside them.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.__recover = False
+
+    def DisableStats(self):
+        """
+        DisableStats stops counting and discards the counters.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.__stats = None
+
+    def GetStats(self):
+        """
+        GetStats
+
+        Returns
+        -------
+        dictionary : a snapshot of the counters (see DecoderStats), or None if statistics are not enabled
+
+        """
+        if self.__stats is None:
+            return None
+        if self.__inMessage:
+            pending = self.__streamOffset - self.__messageOffset
+        else:
+            pending = 1 if self.__dleReceived else 0
+        return self.__stats.Snapshot(pending)
+
+    def ResetStats(self):
+        """
+        ResetStats sets all the counters to zero.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.__stats is not None:
+            self.__stats.Reset()
+
+    def _SaveState(self, state):
+        """
+        _SaveState copies the framing state into a _FramingState, so that it can be restored with _LoadState.
+
+        Parameters
+        ----------
+        state : _FramingState to update
+
+        Returns
+        -------
+        None.
+        """
+        state.InMessage = self.__inMessage
+        state.DleReceived = self.__dleReceived
+        state.StreamOffset = self.__streamOffset
+        state.MessageOffset = self.__messageOffset
+        state.Partial = bytes(self.__currentMessage) if self.__inMessage and self.__currentMessage else None
+
+    def _LoadState(self, state):
+        """
+        _LoadState restores framing state saved by _SaveState, so that decoding carries on from where that stream
+        left off.
+
+        Parameters
+        ----------
+        state : _FramingState to restore
+
+        Returns
+        -------
+        None.
+        """
+        self.__inMessage = state.InMessage
+        self.__dleReceived = state.DleReceived
+        self.__streamOffset = state.StreamOffset
+        self.__messageOffset = state.MessageOffset
+        self.__currentMessage.clear()
+        if state.Partial is not None:
+            self.__currentMessage += state.Partial
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from LNAV import LNAV, LNAV_PAYLOAD_LENGTH
+from MultiplexedDecoder import _MessageId, _XorChecksum
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed to encode arrays
+    np = None
+
+class MultiplexedEncoder:
+    """
+    A Class which encodes Sonardyne Multiplexed Packets - the inverse of MultiplexedDecoder.  Each message is given a
+    2 byte header holding the hasTime flag and the message ID, followed by the payload and an XOR checksum.  Any DLE
+    bytes are escaped with another DLE, and the message is framed with DLE+STX / DLE+ETX.
+
+    Methods
+    -------
+    EncodeMessage(message id, payload byte array) returns byte array
+
+    EncodeLnav(LNAV object) returns byte array
+
+    EncodeLnavBatch(list of LNAV objects, or dictionary of arrays) returns byte array
+    """
+
+    def __init__(self, hasTime=False):
+        """
+        Parameters
+        ----------
+        hasTime : value of the hasTime flag in the header of each message
+        """
+        self.__hasTime = hasTime
+
+    def __Header(self, messageId):
+        return bytes([(0x80 if self.__hasTime else 0x00) | ((messageId >> 8) & 0x03), messageId & 0xFF])
+
+    def EncodeMessage(self, messageId, payload):
+        """
+        EncodeMessage() encodes a single message.
+
+        Parameters
+        ----------
+        messageId : ID of the message (0 to 1023)
+        payload : byte array - the message payload
+
+        Returns
+        -------
+        bytes : the byte-stuffed, framed message
+        """
+        message = bytearray(self.__Header(messageId))
+        message += payload
+        message.append(_XorChecksum(message))
+        return b"\x10\x02" + bytes(message).replace(b"\x10", b"\x10\x10") + b"\x10\x03"
+
+    def EncodeLnav(self, lnav):
+        """
+        EncodeLnav() encodes a single LNAV message.
+
+        Parameters
+        ----------
+        lnav : LNAV object (or LazyLNAV object) to encode
+
+        Returns
+        -------
+        bytes : the byte-stuffed, framed message
+        """
+        return self.EncodeMessage(_MessageId.LNAV.value, lnav.Encode())
+
+    def EncodeLnavBatch(self, lnavs):
+        """
+        EncodeLnavBatch() encodes many LNAV messages into one contiguous buffer, as they would appear in a stream.
+
+        Parameters
+        ----------
+        lnavs : either a list of LNAV objects, or a dictionary of arrays with one element per LNAV in the form
+        returned by LNAV.DecodeBatch().  The dictionary form is encoded with whole-array operations, and requires numpy.
+
+        Returns
+        -------
+        bytes : the byte-stuffed, framed messages
+        """
+        if not isinstance(lnavs, dict):
+            return b"".join([self.EncodeLnav(lnav) for lnav in lnavs])
+
+        if np is None:
+            raise ImportError("MultiplexedEncoder.EncodeLnavBatch requires numpy to encode arrays")
+
+        payloads = LNAV.EncodeBatch(lnavs).view(np.uint8).reshape(-1, LNAV_PAYLOAD_LENGTH)
+        count = len(payloads)
+
+        # Lay out each framed message as DLE STX, header, payload, checksum, DLE ETX
+        messageLength = 2 + LNAV_PAYLOAD_LENGTH + 1
+        frames = np.empty((count, messageLength + 4), dtype=np.uint8)
+        frames[:, 0:2] = (0x10, 0x02)
+        frames[:, 2:4] = np.frombuffer(self.__Header(_MessageId.LNAV.value), dtype=np.uint8)
+        frames[:, 4:4 + LNAV_PAYLOAD_LENGTH] = payloads
+        frames[:, messageLength + 1] = np.bitwise_xor.reduce(frames[:, 2:messageLength + 1], axis=1)
+        frames[:, messageLength + 2:] = (0x10, 0x03)
+
+        # Escape the DLEs in the messages by repeating them, but not the DLEs of the DLE+STX / DLE+ETX
+        repeats = np.ones(frames.shape, dtype=np.intp)
+        repeats[:, 2:messageLength + 2] += frames[:, 2:messageLength + 2] == 0x10
+        return np.repeat(frames.ravel(), repeats.ravel()).tobytes()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import mmap
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from CaptureFile import CaptureFile
+from LNAV import LNAV, LNAV_PAYLOAD_LENGTH
+from MultiplexedDecoder import _MessageId
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is needed to return the decoded columns
+    np = None
+
+# Number of shards given to each process, so that a slow shard doesn't leave the other processes idle
+_SHARDS_PER_PROCESS = 4
+
+# Capture files smaller than this aren't worth splitting
+_MIN_SHARD_SIZE = 1 << 20
+
+def FindShards(path, count):
+    """
+    FindShards() splits a capture file into about count shards which can be decoded independently.  Each shard
+    starts at a DLE+STX which is not itself part of an escaped DLE+DLE.  A DLE+STX always starts a new message, so the
+    decoder reaches the same state there whatever came before it, and no message can straddle two shards.
+
+    Parameters
+    ----------
+    path : capture file
+    count : number of shards wanted
+
+    Returns
+    -------
+    list of (start offset, end offset) tuples covering the whole file, in file order
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+
+    starts = [0]
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for i in range(1, count):
+            pos = max(starts[-1] + 1, size * i // count)
+            while True:
+                pos = data.find(b"\x10\x02", pos)
+                if pos < 0:
+                    break
+                # Count the DLEs before this one - if there's an odd number then this DLE is escaping another DLE
+                run = pos
+                while run > 0 and data[run - 1] == 0x10:
+                    run -= 1
+                if (pos - run) % 2 == 0:
+                    break
+                pos += 1
+            if pos < 0:
+                break
+            starts.append(pos)
+
+    return list(zip(starts, starts[1:] + [size]))
+
+def _DecodeShard(path, start, end):
+    """
+    _DecodeShard is run in a worker process.  It frames one shard of a capture file and returns the LNAVs it contains
+    as compact arrays rather than LNAV objects, so that very little has to be sent back to the parent process.
+
+    Parameters
+    ----------
+    path : capture file
+    start : file offset of the start of the shard
+    end : file offset of the end of the shard
+
+    Returns
+    -------
+    tuple of (array of message file offsets, bytes of LNAV payloads packed back to back)
+    """
+    offsets = array("Q")
+    payloads = bytearray()
+    with CaptureFile(path) as capture:
+        for frame in capture.RawFrames(start, end):
+            if frame.ChecksumOk and frame.MessageId == _MessageId.LNAV.value and len(frame.Message) == LNAV_PAYLOAD_LENGTH + 3:
+                offsets.append(frame.Offset)
+                payloads += frame.Message[2:LNAV_PAYLOAD_LENGTH + 2]
+    return offsets, bytes(payloads)
+
+def DecodeCaptureParallel(path, processes=None):
+    """
+    DecodeCaptureParallel() decodes all of the LNAVs in a capture file using a pool of processes.  The file is split
+    into shards at safe DLE+STX boundaries, each shard is decoded in a worker process, and the results are merged in
+    file order.  The result is the same as decoding the file serially.  Requires numpy.
+
+    Parameters
+    ----------
+    path : capture file
+    processes : number of worker processes, or None to use one per CPU
+
+    Returns
+    -------
+    dictionary : the columns returned by LNAV.DecodeBatch(), plus an "Offset" column holding the file offset of each
+    message
+    """
+    if np is None:
+        raise ImportError("DecodeCaptureParallel requires numpy")
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    size = os.path.getsize(path)
+    count = max(1, min(processes * _SHARDS_PER_PROCESS, size // _MIN_SHARD_SIZE))
+    shards = FindShards(path, count)
+
+    offsets = array("Q")
+    payloads = []
+    if len(shards) <= 1 or processes <= 1:
+        for start, end in shards:
+            shardOffsets, shardPayloads = _DecodeShard(path, start, end)
+            offsets += shardOffsets
+            payloads.append(shardPayloads)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            # map() returns the results in shard order, whichever order the shards finish in
+            for shardOffsets, shardPayloads in pool.map(_DecodeShard, [path] * len(shards), *zip(*shards)):
+                offsets += shardOffsets
+                payloads.append(shardPayloads)
+
+    columns = LNAV.DecodeBatch(b"".join(payloads))
+    columns["Offset"] = np.array(offsets, dtype=np.uint64)
+    return columns
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Replays a capture file over a TCP or UDP socket, paced by the TimeOfValidity of its LNAVs, so that downstream systems
+# can be tested with real timing and without a live vehicle.  With --measure the replay is received and decoded by a
+# MultiplexedDecoder in the same process, and the latency from each LNAV being sent to it being decoded is reported.
+# Run "python ReplayCapture.py --help" for the options.
+
+import argparse
+import socket
+import threading
+import time
+from CaptureFile import CaptureFile
+from DecoderStats import LatencyHistogram
+from LNAV import LNAV_PAYLOAD_LENGTH
+from MultiplexedDecoder import MultiplexedDecoder, _MessageId
+
+# Largest UDP payload sent in one datagram
+_MAX_DATAGRAM = 65000
+
+def _Chunks(capture):
+    """
+    _Chunks is a generator which splits a capture file into the bytes to send for each message - everything after the
+    end of the previous message up to the end of this one, so that anything recorded between messages is replayed too.
+
+    Parameters
+    ----------
+    capture : CaptureFile
+
+    Returns
+    -------
+    generator of (TimeOfValidity for LNAVs or None, bytes)
+    """
+    previousEnd = 0
+    for frame in capture.RawFrames():
+        timeOfValidity = None
+        if frame.ChecksumOk and frame.MessageId == _MessageId.LNAV.value and len(frame.Message) == LNAV_PAYLOAD_LENGTH + 3:
+            timeOfValidity = int.from_bytes(frame.Message[2:8], "little")
+        end = frame.Offset + frame.Length
+        yield timeOfValidity, capture.ReadBytes(previousEnd, end - previousEnd)
+        previousEnd = end
+    if previousEnd < len(capture):
+        yield None, capture.ReadBytes(previousEnd, len(capture) - previousEnd)
+
+def Replay(path, send, speed=1.0, ticksPerSecond=1e6, onSend=None):
+    """
+    Replay() sends a capture file one message at a time.  Each LNAV is sent when its TimeOfValidity falls due, and
+    other messages are sent straight after the message before them.  If TimeOfValidity goes backwards, the pacing
+    starts again from that LNAV.
+
+    Parameters
+    ----------
+    path : capture file to replay
+    send : function which sends bytes
+    speed : replay speed - 1 for real time, 10 for ten times real time, or 0 (or None) for as fast as possible
+    ticksPerSecond : number of TimeOfValidity units in a second
+    onSend : function(TimeOfValidity, time.perf_counter_ns()) called just before each LNAV is sent, or None
+
+    Returns
+    -------
+    dictionary : Messages and Bytes sent, Seconds taken, MessagesPerSecond, MBPerSecond, and Jitter (a
+    LatencyHistogram snapshot of how late each paced LNAV was sent)
+    """
+    jitter = LatencyHistogram()
+    messages = 0
+    byteCount = 0
+    baseTime = None
+    baseDue = 0
+    lastTime = None
+    lastDue = 0
+
+    start = time.perf_counter_ns()
+    with CaptureFile(path) as capture:
+        for timeOfValidity, data in _Chunks(capture):
+            now = None
+            if speed and timeOfValidity is not None:
+                if baseTime is None or timeOfValidity < lastTime:
+                    baseTime = timeOfValidity
+                    baseDue = lastDue
+                due = start + baseDue + int((timeOfValidity - baseTime) * 1e9 / (ticksPerSecond * speed))
+                lastTime = timeOfValidity
+                lastDue = due - start
+
+                wait = due - time.perf_counter_ns()
+                if wait > 0:
+                    time.sleep(wait / 1e9)
+                now = time.perf_counter_ns()
+                jitter.Record(max(0, now - due))
+
+            if onSend is not None and timeOfValidity is not None:
+                onSend(timeOfValidity, now if now is not None else time.perf_counter_ns())
+            send(data)
+            messages += 1
+            byteCount += len(data)
+    seconds = (time.perf_counter_ns() - start) / 1e9
+
+    return {
+        "Messages": messages,
+        "Bytes": byteCount,
+        "Seconds": seconds,
+        "MessagesPerSecond": messages / seconds if seconds else 0.0,
+        "MBPerSecond": byteCount / seconds / 1e6 if seconds else 0.0,
+        "Jitter": jitter.Snapshot(),
+    }
+
+def ServeTcp(path, host, port, speed=1.0, ticksPerSecond=1e6, onSend=None, ready=None):
+    """
+    ServeTcp() waits for one client to connect, replays a capture file to it and closes the connection.
+
+    Parameters
+    ----------
+    path, speed, ticksPerSecond, onSend : see Replay()
+    host, port : address to listen on (port 0 picks a free port)
+    ready : function called with the (host, port) being listened on once clients can connect, or None
+
+    Returns
+    -------
+    dictionary : see Replay()
+    """
+    with socket.create_server((host, port)) as server:
+        if ready is not None:
+            ready(server.getsockname())
+        connection, address = server.accept()
+        with connection:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return Replay(path, connection.sendall, speed, ticksPerSecond, onSend)
+
+def ServeUdp(path, address, speed=1.0, ticksPerSecond=1e6, onSend=None):
+    """
+    ServeUdp() replays a capture file as UDP datagrams, one per message, followed by an empty datagram to mark the
+    end of the replay.
+
+    Parameters
+    ----------
+    path, speed, ticksPerSecond, onSend : see Replay()
+    address : (host, port) to send to
+
+    Returns
+    -------
+    dictionary : see Replay()
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        def Send(data):
+            for i in range(0, len(data), _MAX_DATAGRAM):
+                sock.sendto(data[i:i + _MAX_DATAGRAM], address)
+
+        results = Replay(path, Send, speed, ticksPerSecond, onSend)
+        sock.sendto(b"", address)
+        return results
+
+def Measure(path, udp=False, speed=1.0, ticksPerSecond=1e6):
+    """
+    Measure() replays a capture file over the loopback interface to a MultiplexedDecoder in this process, and
+    measures the time from each LNAV being sent to its callback being called.
+
+    Parameters
+    ----------
+    path, speed, ticksPerSecond : see Replay()
+    udp : True to replay over UDP, False for TCP
+
+    Returns
+    -------
+    tuple of (dictionary from Replay(), LatencyHistogram snapshot of the end to end latency, decoder statistics)
+    """
+    sent = {}
+    latency = LatencyHistogram()
+
+    def OnLnav(lnav):
+        sentAt = sent.pop(lnav.TimeOfValidity, None)
+        if sentAt is not None:
+            latency.Record(time.perf_counter_ns() - sentAt)
+
+    decoder = MultiplexedDecoder()
+    decoder.EnableStats(latency=True)
+    decoder.AddLnavCallback(OnLnav)
+
+    results = {}
+    finished = threading.Event()
+    if udp:
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        receiver.bind(("127.0.0.1", 0))
+        # The replay may pause for any length of time, so the receiver wakes up regularly to see whether the sender
+        # has finished, in case the end of replay datagram was lost
+        receiver.settimeout(0.1)
+
+        def SendUdp():
+            try:
+                results.update(ServeUdp(path, receiver.getsockname(), speed, ticksPerSecond, sent.__setitem__))
+            finally:
+                finished.set()
+        sender = threading.Thread(target=SendUdp)
+    else:
+        listening = threading.Event()
+        addresses = []
+        sender = threading.Thread(target=lambda: results.update(
+            ServeTcp(path, "127.0.0.1", 0, speed, ticksPerSecond, sent.__setitem__,
+                     lambda address: (addresses.append(address), listening.set()))))
+    sender.start()
+
+    if not udp:
+        listening.wait()
+        receiver = socket.create_connection(addresses[0])
+
+    with receiver:
+        while True:
+            try:
+                data = receiver.recv(65536)
+            except socket.timeout:
+                # Once the sender has finished, a whole timeout without data means the end datagram was lost
+                if finished.is_set():
+                    break
+                continue
+            if not data:
+                break
+            decoder.DecodeBytes(data)
+    sender.join()
+
+    return results, latency.Snapshot(), decoder.GetStats()
+
+def _Microseconds(histogram):
+    return "mean {:.1f}, p50 {:.1f}, p99 {:.1f}, max {:.1f} us".format(
+        histogram["MeanNs"] / 1e3, histogram["P50Ns"] / 1e3, histogram["P99Ns"] / 1e3, histogram["MaxNs"] / 1e3)
+
+def _PrintReplay(results):
+    print("Messages sent : {}".format(results["Messages"]))
+    print("Replay time : {:.2f} s".format(results["Seconds"]))
+    print("Achieved rate : {:.0f} messages/s, {:.2f} MB/s".format(results["MessagesPerSecond"], results["MBPerSecond"]))
+    if results["Jitter"]["Count"]:
+        print("Pacing jitter : {}".format(_Microseconds(results["Jitter"])))
+
+def Main():
+    parser = argparse.ArgumentParser(description="Replay a multiplexed capture file over TCP or UDP, paced by LNAV TimeOfValidity")
+    parser.add_argument("capture", help="capture file of raw multiplexed bytes")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed: 1 for real time, N for N times real time, 0 for as fast as possible")
+    parser.add_argument("--ticks-per-second", type=float, default=1e6, help="number of TimeOfValidity units in a second")
+    parser.add_argument("--udp", action="store_true", help="send UDP datagrams instead of serving a TCP connection")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (TCP) or send to (UDP)")
+    parser.add_argument("--port", type=int, default=50000, help="port to listen on (TCP) or send to (UDP)")
+    parser.add_argument("--measure", action="store_true", help="decode the replay in this process over the loopback interface and report the end to end latency")
+    args = parser.parse_args()
+
+    if args.measure:
+        results, latency, stats = Measure(args.capture, args.udp, args.speed, args.ticks_per_second)
+        _PrintReplay(results)
+        print("LNAVs decoded : {}".format(latency["Count"]))
+        if latency["Count"]:
+            print("End to end latency : {}".format(_Microseconds(latency)))
+            print("Decode latency : {}".format(_Microseconds(stats["DecodeLatency"])))
+            print("Callback latency : {}".format(_Microseconds(stats["CallbackLatency"])))
+        return
+
+    if args.udp:
+        print("Sending to {}:{}".format(args.host, args.port))
+        results = ServeUdp(args.capture, (args.host, args.port), args.speed, args.ticks_per_second)
+    else:
+        results = ServeTcp(args.capture, args.host, args.port, args.speed, args.ticks_per_second,
+                           ready=lambda address: print("Waiting for a connection on {}:{}".format(*address)))
+    _PrintReplay(results)
+
+if __name__ == "__main__":
+    Main()
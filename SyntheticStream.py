@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 Sonardyne International Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import random
+from LNAV import LNAV_PAYLOAD_LENGTH
+from MultiplexedDecoder import _MessageId
+from MultiplexedEncoder import MultiplexedEncoder
+
+_DLE = 0x10
+
+def GenerateStream(frameCount, seed=0, dleDensity=1.0 / 256, corruptRate=0.0, maxNoise=0):
+    """
+    GenerateStream() builds a multiplexed byte stream of LNAV messages with random contents, for testing and
+    benchmarking the decoder.  The same seed always gives the same stream.
+
+    Parameters
+    ----------
+    frameCount : number of LNAV messages to generate
+    seed : random number seed
+    dleDensity : probability of each payload byte being a DLE, which has to be escaped in the stream
+    corruptRate : probability of a message having one of its bytes changed after the checksum is calculated, so that
+    the decoder should reject it
+    maxNoise : up to this many random bytes (not including DLE) are inserted between messages
+
+    Returns
+    -------
+    tuple of (bytes containing the stream, list of the payloads of the uncorrupted messages in stream order)
+    """
+    rng = random.Random(seed)
+    # Every byte value except DLE
+    others = bytes(value for value in range(256) if value != _DLE)
+    encoder = MultiplexedEncoder()
+
+    stream = bytearray()
+    payloads = []
+    for i in range(frameCount):
+        if maxNoise:
+            stream += bytes(rng.choice(others) for j in range(rng.randint(0, maxNoise)))
+
+        payload = bytes(_DLE if rng.random() < dleDensity else rng.choice(others) for j in range(LNAV_PAYLOAD_LENGTH))
+        frame = bytearray(encoder.EncodeMessage(_MessageId.LNAV.value, payload))
+
+        if rng.random() < corruptRate:
+            # Change a byte between the header and the DLE+ETX to a different non-DLE value, which breaks the
+            # checksum.  DLEs are skipped so that the framing is left intact.
+            index = rng.choice([i for i in range(4, len(frame) - 2) if frame[i] != _DLE])
+            frame[index] = rng.choice(bytes(value for value in others if value != frame[index]))
+        else:
+            payloads.append(payload)
+        stream += frame
+
+    return bytes(stream), payloads
+
+def InjectErrors(data, errorRate, seed=0):
+    """
+    InjectErrors() damages a stream the way a noisy link might, by dropping, replacing or inserting random bytes
+    (including DLEs).  Unlike the corruptRate of GenerateStream(), this can break the framing as well as checksums.
+
+    Parameters
+    ----------
+    data : bytes to damage
+    errorRate : probability of each byte being dropped, replaced or having a byte inserted before it
+    seed : random number seed
+
+    Returns
+    -------
+    bytes : the damaged stream
+    """
+    rng = random.Random(seed)
+    positions = sorted(rng.sample(range(len(data)), round(len(data) * errorRate)))
+
+    damaged = bytearray()
+    previous = 0
+    for position in positions:
+        damaged += data[previous:position]
+        kind = rng.randrange(3)
+        if kind == 1:
+            damaged.append(rng.randrange(256))
+        elif kind == 2:
+            damaged.append(rng.randrange(256))
+            damaged.append(data[position])
+        # kind 0 drops the byte
+        previous = position + 1
+    damaged += data[previous:]
+    return bytes(damaged)
+
+def Chunks(data, chunkSize):
+    """
+    Chunks() splits a stream into pieces of chunkSize bytes, as they might be delivered by a serial port or socket.
+
+    Parameters
+    ----------
+    data : bytes to split
+    chunkSize : size of each piece (the last one may be shorter)
+
+    Returns
+    -------
+    list of bytes
+    """
+    return [data[i:i + chunkSize] for i in range(0, len(data), chunkSize)]